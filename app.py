@@ -1,36 +1,224 @@
 import os
+import random
 import time
 import json
+import logging
 import re
+import socket
+import sys
+import threading
 import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
 from datetime import datetime
+from cache import LookupCache
+from classifier import classify_fiction, extract_series
+from ledger import WorkLedger
+from ratelimit import TokenBucket
+from http_client import HttpClient, RequestCancelled
+from jobs import JobQueue
+from leases import LeaseStore
+from metrics import Metrics
+from offline_index import OfflineIndex
+from ranking import rank_results
+from records import BookJob, BookRecord
+from routing import ProviderRouter
+from schema import DatabaseSchema, validate_properties
+from tenants import Tenant, FairScheduler, load_tenant_config
 
 # Load environment variables
 load_dotenv()
 
+# Logging configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("notion_books")
+
 app = Flask(__name__)
 
+# Per-stage timers and counters, served at /metrics
+metrics = Metrics("notion_books")
+metrics.describe("stage", "Time spent in each pipeline stage")
+metrics.describe("search", "Time spent waiting on each book provider")
+metrics.describe("books_processed", "Books processed, by outcome")
+metrics.describe("lookup_cache", "Lookup cache results, by provider")
+metrics.describe("provider_circuit_state", "1 for each provider's current circuit breaker state")
+metrics.describe("provider_skipped", "Lookups that left a provider out because its circuit was open")
+metrics.describe("lease_takeovers", "Pages taken over from a worker that stopped sending heartbeats")
+
 # Notion API configuration
 NOTION_API_KEY = os.getenv("NOTION_API_KEY", "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")
 DATABASE_ID = os.getenv("DATABASE_ID", "9c847e888b7d4cf19630c770c08fce8c")
-CHECK_INTERVAL = int(60)  # Default to 60 seconds
+
+# Adaptive polling: poll quickly while new entries keep appearing, back off when idle
+POLL_MIN_INTERVAL = float(os.getenv("POLL_MIN_INTERVAL", 5))
+POLL_MAX_INTERVAL = float(os.getenv("POLL_MAX_INTERVAL", os.getenv("CHECK_INTERVAL", 300)))
+POLL_BACKOFF_FACTOR = float(os.getenv("POLL_BACKOFF_FACTOR", 2))
+POLL_JITTER = float(os.getenv("POLL_JITTER", 0.2))  # +/- 20% so deployments drift apart
+
+# /webhook and /fetch hand their work to a background thread; set to false on servers that don't
+# run app-started threads (PythonAnywhere's uWSGI), so the request runs the job itself
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "true").lower() == "true"
+
+# Incremental sync configuration
+INCREMENTAL_SYNC = os.getenv("INCREMENTAL_SYNC", "true").lower() == "true"
+SYNC_STATE_FILE = os.getenv("SYNC_STATE_FILE", "sync_state.json")
+FULL_SYNC_INTERVAL = int(os.getenv("FULL_SYNC_INTERVAL", 3600))  # Re-scan everything hourly
+
+# Horizontal scaling: WORKER_COUNT processes (see workers.py) split the pages between them by
+# page ID hash, and lease each page in a shared SQLite file while they work on it
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", 1))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", 0))
+# Leases alone (no sharding) keep several unsharded processes, e.g. web workers, off each other's pages
+LEASES_ENABLED = WORKER_COUNT > 1 or os.getenv("LEASES_ENABLED", "false").lower() == "true"
+LEASE_PATH = os.getenv("LEASE_PATH", "leases.sqlite3")
+LEASE_TTL = float(os.getenv("LEASE_TTL", 60))  # A silent worker's pages are taken over after this
 
 NOTION_API_URL = "https://api.notion.com/v1"
 NOTION_VERSION = "2022-02-22"  # Updated to a version that supports page covers and icons
 
-# Headers for Notion API
-notion_headers = {
-    "Authorization": f"Bearer {NOTION_API_KEY}",
-    "Content-Type": "application/json",
-    "Notion-Version": NOTION_VERSION,
-}
+# Serve several (token, database) pairs from one process. A JSON list or object
+# of tenants; when neither is set, NOTION_API_KEY / DATABASE_ID are the only tenant.
+TENANTS = os.getenv("TENANTS")
+TENANTS_FILE = os.getenv("TENANTS_FILE")
+
+# Database schema is fetched once and refreshed on this interval
+SCHEMA_VALIDATION = os.getenv("SCHEMA_VALIDATION", "true").lower() == "true"
+SCHEMA_REFRESH_INTERVAL = int(os.getenv("SCHEMA_REFRESH_INTERVAL", 3600))
 
 # Book API configurations
 GOOGLE_BOOKS_API_URL = "https://www.googleapis.com/books/v1/volumes"
 OPEN_LIBRARY_API_URL = "https://openlibrary.org/search.json"
 
+# Each search fetches this many candidates and keeps the best match to the search term
+SEARCH_CANDIDATES = int(os.getenv("SEARCH_CANDIDATES", 5))
+MATCH_MIN_SCORE = float(os.getenv("MATCH_MIN_SCORE", 0.3))  # Title searches with no candidate this good are misses
+
+# Ask every API for only the fields we read: smaller responses, less JSON to parse and keep
+FIELD_PROJECTION = os.getenv("FIELD_PROJECTION", "true").lower() == "true"
+
+# What search_google_books() reads, in Google's partial response syntax
+GOOGLE_BOOKS_FIELDS = (
+    "items(volumeInfo(title,subtitle,authors,description,categories,averageRating,"
+    "pageCount,infoLink,imageLinks,publishedDate,industryIdentifiers))"
+)
+# What parse_open_library_doc() reads from a search doc
+OPEN_LIBRARY_FIELDS = (
+    "key,title,subtitle,author_name,description,subject,number_of_pages_median,"
+    "cover_i,first_publish_year,isbn,series"
+)
+
+# Concurrency and rate limit configuration
+PROCESS_CONCURRENCY = int(os.getenv("PROCESS_CONCURRENCY", 4))  # 1 = process books one at a time, in order
+NOTION_RATE_LIMIT = float(os.getenv("NOTION_RATE_LIMIT", 3))  # Notion allows ~3 requests/sec per integration
+GOOGLE_BOOKS_RATE_LIMIT = float(os.getenv("GOOGLE_BOOKS_RATE_LIMIT", 10))
+OPEN_LIBRARY_RATE_LIMIT = float(os.getenv("OPEN_LIBRARY_RATE_LIMIT", 5))
+
+def worker_rate(rate):
+    """This process's share of an API rate limit; the APIs count requests per key, not per process."""
+    return rate / WORKER_COUNT
+
+google_books_limiter = TokenBucket(worker_rate(GOOGLE_BOOKS_RATE_LIMIT))
+open_library_limiter = TokenBucket(worker_rate(OPEN_LIBRARY_RATE_LIMIT))
+
+# Hedged lookup configuration
+HEDGED_LOOKUP = os.getenv("HEDGED_LOOKUP", "false").lower() == "true"
+HEDGE_DELAY = float(os.getenv("HEDGE_DELAY", 1.0))  # Seconds without an answer before the next provider is asked
+
+# Adaptive provider routing: order providers by recent latency and hit rate, and stop
+# calling one that keeps failing until a probe request gets through again
+PROVIDER_ROUTING = os.getenv("PROVIDER_ROUTING", "true").lower() == "true"
+PROVIDER_HEALTH_WINDOW = int(os.getenv("PROVIDER_HEALTH_WINDOW", 50))  # Recent searches per provider and query kind
+PROVIDER_MIN_SAMPLES = int(os.getenv("PROVIDER_MIN_SAMPLES", 10))  # Keep the default order until there's enough data
+PROVIDER_SWITCH_RATIO = float(os.getenv("PROVIDER_SWITCH_RATIO", 2))  # How much better a provider must look to move up
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))  # Errors in a row that open a circuit
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", 30))  # Seconds before a half-open probe
+
+provider_router = ProviderRouter(
+    ["google_books", "open_library"],
+    window=PROVIDER_HEALTH_WINDOW,
+    min_samples=PROVIDER_MIN_SAMPLES,
+    switch_ratio=PROVIDER_SWITCH_RATIO,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    cooldown=BREAKER_COOLDOWN,
+    enabled=PROVIDER_ROUTING,
+    metrics=metrics,
+)
+
+# Shared pool for hedged provider requests, separate from the book workers
+lookup_executor = ThreadPoolExecutor(max_workers=max(4, PROCESS_CONCURRENCY * 4))
+
+# Bulk ISBN imports are resolved this many at a time with one Open Library request (1 disables batching)
+ISBN_BATCH_SIZE = int(os.getenv("ISBN_BATCH_SIZE", 40))
+
+# HTTP client configuration
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", 4))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", 0.5))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", 30))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", max(10, PROCESS_CONCURRENCY * 2)))
+
+http_client = HttpClient(
+    metrics=metrics,
+    timeout=HTTP_TIMEOUT,
+    max_retries=HTTP_MAX_RETRIES,
+    backoff_base=HTTP_BACKOFF_BASE,
+    backoff_max=HTTP_BACKOFF_MAX,
+    pool_size=HTTP_POOL_SIZE,
+)
+
+# Processing engine: "threads" (worker pool, blocking HTTP) or "async" (one event loop for
+# scans, lookups and updates, see async_engine.py; needs aiohttp)
+ENGINE = os.getenv("ENGINE", "threads").lower()
+ASYNC_MAX_BOOKS = int(os.getenv("ASYNC_MAX_BOOKS", 200))  # Books in flight at once
+ASYNC_HOST_CONNECTIONS = int(os.getenv("ASYNC_HOST_CONNECTIONS", 20))  # Concurrent requests per API host
+
+engine = None
+if ENGINE == "async":
+    from async_engine import AsyncEngine
+    # The engine calls back into this module, whether it was imported as "app" or run as a script
+    engine = AsyncEngine(sys.modules[__name__], max_books=ASYNC_MAX_BOOKS, host_connections=ASYNC_HOST_CONNECTIONS)
+
+# Lookup cache configuration
+LOOKUP_CACHE_ENABLED = os.getenv("LOOKUP_CACHE_ENABLED", "true").lower() == "true"
+LOOKUP_CACHE_PATH = os.getenv("LOOKUP_CACHE_PATH", "lookup_cache.sqlite3")
+LOOKUP_CACHE_TTL = int(os.getenv("LOOKUP_CACHE_TTL", 7 * 24 * 3600))  # Default to a week
+LOOKUP_CACHE_NEGATIVE_TTL = int(os.getenv("LOOKUP_CACHE_NEGATIVE_TTL", 24 * 3600))  # Misses expire after a day
+LOOKUP_CACHE_MAX_ENTRIES = int(os.getenv("LOOKUP_CACHE_MAX_ENTRIES", 50000))
+
+lookup_cache = None
+if LOOKUP_CACHE_ENABLED:
+    lookup_cache = LookupCache(
+        LOOKUP_CACHE_PATH,
+        ttl=LOOKUP_CACHE_TTL,
+        max_entries=LOOKUP_CACHE_MAX_ENTRIES,
+        negative_ttl=LOOKUP_CACHE_NEGATIVE_TTL,
+    )
+    metrics.gauge("lookup_cache_entries", lambda: lookup_cache.stats()["entries"])
+
+# Local Open Library index (see offline_index.py), tried before any remote search
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH")
+
+local_index = OfflineIndex(LOCAL_INDEX_PATH) if LOCAL_INDEX_PATH else None
+
+# Books that fail (no match, or a rejected update) are retried with exponential backoff
+LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "true").lower() == "true"
+LEDGER_PATH = os.getenv("LEDGER_PATH", "work_ledger.sqlite3")
+LEDGER_BACKOFF_BASE = float(os.getenv("LEDGER_BACKOFF_BASE", 300))  # 5 minutes after the first failure
+LEDGER_BACKOFF_MAX = float(os.getenv("LEDGER_BACKOFF_MAX", 24 * 3600))  # At least daily retries
+
+work_ledger = None
+if LEDGER_ENABLED:
+    work_ledger = WorkLedger(LEDGER_PATH, LEDGER_BACKOFF_BASE, LEDGER_BACKOFF_MAX)
+    metrics.gauge("ledger_waiting", lambda: work_ledger.stats()["waiting"])
+
+lease_store = None
+if LEASES_ENABLED:
+    lease_store = LeaseStore(LEASE_PATH, LEASE_TTL, f"{socket.gethostname()}:{os.getpid()}",
+                             shard=WORKER_INDEX, shards=WORKER_COUNT)
+    metrics.gauge("leases_held", lambda: lease_store.stats()["held"])
+
 # Property names in Notion database
 PROPERTY_TITLE = "title"
 PROPERTY_DESCRIPTION = "Description"
@@ -46,131 +234,475 @@ PROPERTY_NON_FICTION = "Non/Fiction"
 PROPERTY_ISBN = "ISBN"
 PROPERTY_SEARCH_TERM = "Search Term"  # Added Search Term property
 
-def query_database():
-    """Query the Notion database for all pages."""
-    url = f"{NOTION_API_URL}/databases/{DATABASE_ID}/query"
+# Everything update_notion_page() may write, so all a page snapshot needs to hold
+WRITTEN_PROPERTIES = (
+    PROPERTY_TITLE, PROPERTY_DESCRIPTION, PROPERTY_AUTHORS, PROPERTY_RATING, PROPERTY_GENRES,
+    PROPERTY_LINK, PROPERTY_PAGES, PROPERTY_COVER, PROPERTY_SERIES, PROPERTY_DATE_PUBLISHED,
+    PROPERTY_NON_FICTION, PROPERTY_ISBN, PROPERTY_SEARCH_TERM,
+)
+
+def default_sync_state_file(name):
+    """Per-tenant sync state file derived from SYNC_STATE_FILE."""
+    root, ext = os.path.splitext(SYNC_STATE_FILE)
+    return f"{root}.{name}{ext or '.json'}"
+
+def worker_sync_state_file(path):
+    """Give each sharded worker its own sync state, since each scans for its own shard."""
+    if WORKER_COUNT <= 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{WORKER_INDEX}{ext or '.json'}"
+
+def build_tenants():
+    """Create the configured tenants, one Notion rate limiter per token."""
+    config = load_tenant_config(TENANTS, TENANTS_FILE)
+    if config is None:
+        config = [{"name": "default", "notion_api_key": NOTION_API_KEY, "database_id": DATABASE_ID,
+                   "sync_state_file": SYNC_STATE_FILE}]
+    
+    limiters = {}
+    built = []
+    for entry in config:
+        api_key = entry["notion_api_key"]
+        # Notion's rate limit is per integration, so databases sharing a token share its budget
+        if api_key not in limiters:
+            limiters[api_key] = TokenBucket(worker_rate(float(entry.get("rate_limit", NOTION_RATE_LIMIT))))
+        tenant = Tenant(
+            entry["name"],
+            api_key,
+            entry["database_id"],
+            NOTION_VERSION,
+            limiters[api_key],
+            worker_sync_state_file(entry.get("sync_state_file") or default_sync_state_file(entry["name"])),
+            webhook_secret=entry.get("webhook_secret"),
+        )
+        tenant.schema = DatabaseSchema(lambda tenant=tenant: fetch_database(tenant), SCHEMA_REFRESH_INTERVAL)
+        built.append(tenant)
+    return built
+
+def get_tenant(tenant=None):
+    """The tenant to act for; the first configured one by default."""
+    return tenant or tenants[0]
+
+def load_sync_state(tenant=None):
+    """Load the incremental sync state saved by the previous run."""
+    path = get_tenant(tenant).sync_state_file
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read sync state %s, falling back to a full scan: %s", path, e)
+        return {}
+
+def save_sync_state(state, tenant=None):
+    """Persist the incremental sync state for the next run."""
+    path = get_tenant(tenant).sync_state_file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def format_notion_timestamp(dt):
+    """Format a UTC datetime the way Notion reports last_edited_time."""
+    # Notion rounds last_edited_time down to the minute, so the watermark is too
+    return dt.replace(second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+def fetch_database(tenant=None):
+    """Get the database object, including its property schema."""
+    tenant = get_tenant(tenant)
+    url = f"{NOTION_API_URL}/databases/{tenant.database_id}"
+    response = http_client.get(url, headers=tenant.headers, limiter=tenant.limiter)
+    if response.status_code != 200:
+        logger.error("Error getting database schema for %s: %s %s", tenant.name, response.status_code, response.text)
+        return None
+    return response.json()
+
+tenants = build_tenants()
+tenants_by_name = {tenant.name: tenant for tenant in tenants}
+
+def title_property_name(tenant=None):
+    """Name of the database's title property."""
+    if SCHEMA_VALIDATION:
+        name = get_tenant(tenant).schema.title_property()
+        if name:
+            return name
+    return "Title"  # Note: Capital "T" in "Title"
+
+def build_query_filter(since=None, tenant=None):
+    """Build the server-side filter for pages whose titles end in a semicolon."""
+    title_filter = {
+        "property": title_property_name(tenant),
+        "title": {"ends_with": ";"}
+    }
+    if not since:
+        return title_filter
+    return {
+        "and": [
+            title_filter,
+            {
+                "timestamp": "last_edited_time",
+                "last_edited_time": {"on_or_after": since}
+            }
+        ]
+    }
+
+def page_property_filter(tenant=None):
+    """Query parameters that trim page objects to the properties we read or write.
+
+    Notion's `filter_properties` takes property IDs, so this needs the
+    database schema. Without it pages come back with every property.
+    """
+    if not (FIELD_PROJECTION and SCHEMA_VALIDATION):
+        return None
+    ids = get_tenant(tenant).schema.property_ids(WRITTEN_PROPERTIES)
+    return {"filter_properties": ids} if ids else None
+
+class QueryFailed(Exception):
+    """Raised when Notion rejects a database query."""
+
+def fetch_query_page(since=None, start_cursor=None, tenant=None):
+    """Fetch one cursor page of semicolon entries from the Notion database."""
+    if engine:
+        return engine.run(engine.fetch_query_page(since, start_cursor, tenant))
+    tenant = get_tenant(tenant)
+    with metrics.timer("stage", stage="query"):
+        response = http_client.post(f"{NOTION_API_URL}/databases/{tenant.database_id}/query", headers=tenant.headers,
+                                    params=page_property_filter(tenant), json=query_payload(since, start_cursor, tenant),
+                                    limiter=tenant.limiter)
+    return query_page_result(response, tenant)
+
+def query_payload(since, start_cursor, tenant):
+    """Body of a database query for one cursor page."""
+    payload = {"filter": build_query_filter(since, tenant), "page_size": 100}
+    if start_cursor:
+        payload["start_cursor"] = start_cursor
+    return payload
+
+def query_page_result(response, tenant):
+    """Return a query response's JSON, or raise QueryFailed if Notion rejected it."""
+    if response.status_code != 200:
+        logger.error("Error querying database for %s: %s %s", tenant.name, response.status_code, response.text)
+        raise QueryFailed(f"Database query returned {response.status_code}")
     
-    all_pages = []
+    return response.json()
+
+def iter_database_pages(since=None, tenant=None):
+    """Yield each cursor page of semicolon entries as soon as it arrives.
+
+    Notion does the filtering server-side. If `since` is given, only pages
+    edited on or after that timestamp are returned. Raises QueryFailed if
+    Notion rejects a request.
+    """
     has_more = True
     start_cursor = None
+    total = 0
     
-    print("Fetching all pages from Notion database...")
+    tenant = get_tenant(tenant)
+    if since:
+        logger.info("Fetching pages ending in semicolons edited since %s (%s)", since, tenant.name)
+    else:
+        logger.info("Fetching all pages ending in semicolons from Notion database (%s)", tenant.name)
     
     while has_more:
-        payload = {}
-        if start_cursor:
-            payload["start_cursor"] = start_cursor
-            
-        response = requests.post(url, headers=notion_headers, json=payload)
-        
-        if response.status_code != 200:
-            print(f"Error querying database: {response.status_code}")
-            print(response.text)
-            return []
-        
-        data = response.json()
+        data = fetch_query_page(since, start_cursor, tenant)
         current_pages = data.get("results", [])
-        all_pages.extend(current_pages)
+        total += len(current_pages)
         
-        print(f"Fetched {len(current_pages)} pages, total so far: {len(all_pages)}")
+        metrics.inc("pages_scanned", len(current_pages), tenant=tenant.name)
+        logger.debug("Fetched %d pages, total so far: %d", len(current_pages), total)
         
         has_more = data.get("has_more", False)
         start_cursor = data.get("next_cursor")
         
-        if has_more:
-            print(f"More pages available, continuing with cursor: {start_cursor}")
-    
-    print(f"Total pages fetched: {len(all_pages)}")
-    
-    # Print titles of all pages
-    semicolon_count = 0
-    print("\nList of all page titles in the database:")
-    for i, page in enumerate(all_pages, 1):
-        # Get the title from the Title property
-        properties = page.get("properties", {})
-        title_property = properties.get("Title", {})  # Note: Capital "T" in "Title"
+        yield current_pages
         
-        if title_property and "title" in title_property:
-            title_arr = title_property["title"]
-            if title_arr and len(title_arr) > 0:
-                title = "".join([text_obj.get("plain_text", "") for text_obj in title_arr])
-                has_semicolon = title.endswith(";")
-                if has_semicolon:
-                    semicolon_count += 1
-                    print(f"{i}. '{title}' [ENDS WITH SEMICOLON]")
-                else:
-                    print(f"{i}. '{title}'")
-            else:
-                print(f"{i}. [Empty title]")
-        else:
-            print(f"{i}. [No Title property found]")
+        if has_more:
+            logger.debug("More pages available, continuing with cursor: %s", start_cursor)
     
-    print(f"\nFound {semicolon_count} pages with titles ending in semicolons")
-    return all_pages
+    logger.info("Total pages fetched for %s: %d", tenant.name, total)
 
-def get_page_properties(page_id):
-    """Get properties of a specific page."""
+def query_database(since=None, tenant=None):
+    """Query the Notion database for pages with titles ending in semicolons."""
+    if engine:
+        return engine.run(engine.query_database(since, tenant))
+    try:
+        return [page for pages in iter_database_pages(since, tenant) for page in pages]
+    except QueryFailed:
+        return None
+
+def get_page(page_id, tenant=None):
+    """Get a page object, with its parent and the properties we read or write."""
+    if engine:
+        return engine.run(engine.get_page(page_id, tenant))
+    tenant = get_tenant(tenant)
     url = f"{NOTION_API_URL}/pages/{page_id}"
-    response = requests.get(url, headers=notion_headers)
+    response = http_client.get(url, headers=tenant.headers, params=page_property_filter(tenant), limiter=tenant.limiter)
+    return page_result(page_id, response)
+
+def page_result(page_id, response):
+    """Return a page response's JSON, or None if Notion rejected the request."""
     if response.status_code != 200:
-        print(f"Error getting page properties: {response.status_code}")
-        print(response.text)
+        logger.error("Error getting page properties for %s: %s %s", page_id, response.status_code, response.text)
         return None
-    return response.json().get("properties", {})
+    return response.json()
 
-def find_books_with_semicolon():
-    """Find books with titles ending in semicolon."""
-    pages = query_database()
-    semicolon_books = []
+def get_page_properties(page_id, tenant=None):
+    """Get properties of a specific page."""
+    page = get_page(page_id, tenant)
+    return page.get("properties", {}) if page is not None else None
+
+def in_tenant_database(page, tenant):
+    """True if the page is a row of the tenant's database, not just any page the integration can see."""
+    database_id = (page.get("parent") or {}).get("database_id") or ""
+    # Configured IDs are often copied from URLs without dashes
+    return database_id.replace("-", "").lower() == tenant.database_id.replace("-", "").lower()
+
+def parse_search_text(text):
+    """Turn what the user typed into a (search query, is ISBN) pair."""
+    search_query = text.strip()
     
-    for page in pages:
-        properties = page.get("properties", {})
-        title_property = properties.get("Title", {})  # Note: Capital "T" in "Title"
-        
-        if title_property and "title" in title_property:
-            title_content = title_property["title"]
-            if title_content and len(title_content) > 0:
-                title = "".join([text_obj.get("plain_text", "") for text_obj in title_content])
-                if title.endswith(";"):
-                    search_query = title[:-1].strip()  # Remove semicolon and whitespace
-                    
-                    # Check if this is likely an ISBN
-                    is_isbn = False
-                    # Remove any non-digit and non-X characters for ISBN check
-                    isbn_candidate = re.sub(r'[^0-9X]', '', search_query)
-                    
-                    # Check if the remaining string could be an ISBN (10 or 13 digits)
-                    if len(isbn_candidate) in [10, 13] and isbn_candidate.isdigit() or (
-                            len(isbn_candidate) == 10 and isbn_candidate[:-1].isdigit() and 
-                            isbn_candidate[-1] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'X']):
-                        is_isbn = True
-                        search_query = f"isbn:{isbn_candidate}"
-                    
-                    semicolon_books.append({
-                        "id": page["id"],
-                        "title": title,
-                        "search_query": search_query,
-                        "is_isbn": is_isbn
-                    })
-    
-    return semicolon_books
-
-def search_google_books(query):
-    """Search for book information using Google Books API."""
-    params = {"q": query, "maxResults": 1}
-    response = requests.get(GOOGLE_BOOKS_API_URL, params=params)
+    # Check if this is likely an ISBN
+    is_isbn = False
+    # Remove any non-digit and non-X characters for ISBN check
+    isbn_candidate = re.sub(r'[^0-9X]', '', search_query)
     
-    if response.status_code != 200:
-        print(f"Error searching Google Books: {response.status_code}")
+    # Check if the remaining string could be an ISBN (10 or 13 digits)
+    if len(isbn_candidate) in [10, 13] and isbn_candidate.isdigit() or (
+            len(isbn_candidate) == 10 and isbn_candidate[:-1].isdigit() and 
+            isbn_candidate[-1] in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'X']):
+        is_isbn = True
+        search_query = f"isbn:{isbn_candidate}"
+    
+    return search_query, is_isbn
+
+def extract_book(page, tenant=None):
+    """Build a book job from a Notion page if its title ends in a semicolon."""
+    properties = page.get("properties", {})
+    # Whatever the database calls it, the title property is the one of type "title"
+    title_property = next(
+        (value for value in properties.values() if isinstance(value, dict) and value.get("type") == "title"),
+        properties.get("Title", {})
+    )
+    
+    if not title_property or "title" not in title_property:
+        return None
+    title_content = title_property["title"]
+    if not title_content:
         return None
     
-    data = response.json()
-    items = data.get("items", [])
+    title = "".join([text_obj.get("plain_text", "") for text_obj in title_content])
+    if not title.endswith(";"):
+        return None
+    
+    search_query, is_isbn = parse_search_text(title[:-1])  # Remove semicolon
+    
+    return BookJob(page["id"], title, search_query, is_isbn, snapshot_page(page), get_tenant(tenant))
+
+PROPERTY_VALUE_TYPES = ("title", "rich_text", "multi_select", "select", "url", "number", "date")
+
+def normalize_property_value(value):
+    """Reduce a property value to a comparable form.
+
+    Accepts both the shape Notion returns when reading a page and the
+    shape we send when writing one, so the two can be compared directly.
+    """
+    if not isinstance(value, dict):
+        return None
+    value_type = value.get("type")
+    if value_type not in PROPERTY_VALUE_TYPES:
+        value_type = next((key for key in PROPERTY_VALUE_TYPES if key in value), None)
+    if value_type is None:
+        return None
     
-    if not items:
+    content = value.get(value_type)
+    if value_type in ("title", "rich_text"):
+        return "".join(
+            text_obj.get("plain_text") or text_obj.get("text", {}).get("content", "")
+            for text_obj in content or []
+        )
+    if value_type == "multi_select":
+        return tuple(sorted(option.get("name", "") for option in content or []))
+    if value_type == "select":
+        return content.get("name") if content else None
+    if value_type == "url":
+        return content or None
+    if value_type == "date":
+        return (content.get("start"), content.get("end")) if content else None
+    return content
+
+def external_url(file_object):
+    """Return the URL of an external cover/icon object, if any."""
+    if isinstance(file_object, dict) and file_object.get("type") == "external":
+        return file_object.get("external", {}).get("url")
+    return None
+
+def snapshot_page(page):
+    """Capture a page's current values in comparable form for diffing later.
+
+    Only what update_notion_page() may write is kept, so the full page
+    JSON can be dropped once the book job is built. Cover and icon are
+    only recorded when the page object includes them.
+    """
+    snapshot = {
+        "properties": {
+            name: normalize_property_value(value)
+            for name, value in page.get("properties", {}).items()
+            if isinstance(value, dict) and value.get("type") in PROPERTY_VALUE_TYPES
+        }
+    }
+    for key in ("cover", "icon"):
+        if key in page:
+            snapshot[key] = external_url(page[key])
+    return snapshot
+
+def diff_page_update(data, current):
+    """Drop properties, cover and icon that already hold the values in `data`."""
+    current_properties = current.get("properties", {})
+    changed = {
+        name: value
+        for name, value in data["properties"].items()
+        if name not in current_properties or normalize_property_value(value) != current_properties[name]
+    }
+    diffed = {"properties": changed} if changed else {}
+    for key in ("cover", "icon"):
+        if key in data and (key not in current or external_url(data[key]) != current[key]):
+            diffed[key] = data[key]
+    return diffed
+
+def iter_books_with_semicolon(since=None, tenant=None):
+    """Yield books with titles ending in semicolon, one cursor page at a time."""
+    tenant = get_tenant(tenant)
+    for pages in iter_database_pages(since, tenant):
+        with metrics.timer("stage", stage="detect"):
+            books = [book for book in (extract_book(page, tenant) for page in pages) if book]
+        metrics.inc("books_detected", len(books), tenant=tenant.name)
+        yield from books
+
+def find_books_with_semicolon(since=None, tenant=None):
+    """Find books with titles ending in semicolon."""
+    try:
+        return list(iter_books_with_semicolon(since, tenant))
+    except QueryFailed:
+        return None
+
+def search_local_index(query):
+    """Search the local Open Library index; same result shape as search_open_library().
+
+    Candidates are ranked like a provider's results, so a local match
+    below MATCH_MIN_SCORE falls through to the remote providers.
+    """
+    with metrics.timer("search", provider="local_index"):
+        if query.startswith("isbn:"):
+            doc = local_index.lookup_isbn(query[len("isbn:"):])
+            docs = [doc] if doc else []
+        else:
+            docs = local_index.search_candidates(query)
+        docs = rank_results(query, docs, describe_open_library_doc, MATCH_MIN_SCORE)
+    metrics.inc("local_index", result="hit" if docs else "miss")
+    if not docs:
+        return None
+    return parse_open_library_doc(docs[0], query)
+
+PROVIDER_LABELS = {"google_books": "Google Books", "open_library": "Open Library"}
+
+def query_kind(query):
+    return "isbn" if query.startswith("isbn:") else "title"
+
+def describe_volume(item):
+    """(title, subtitle, authors, ISBNs) of a Google Books result, for ranking."""
+    volume_info = item.get("volumeInfo", {})
+    isbns = [identifier.get("identifier", "") for identifier in volume_info.get("industryIdentifiers", [])]
+    return volume_info.get("title", ""), volume_info.get("subtitle", ""), volume_info.get("authors", []), isbns
+
+def describe_open_library_doc(doc):
+    """(title, subtitle, authors, ISBNs) of an Open Library search doc, for ranking."""
+    return doc.get("title", ""), doc.get("subtitle", ""), doc.get("author_name", []), doc.get("isbn", [])
+
+PROVIDER_RESULTS = {
+    "google_books": ("items", describe_volume),
+    "open_library": ("docs", describe_open_library_doc),
+}
+
+def provider_search(provider, query, url, params, limiter, cancel=None):
+    """Send one search to a book provider and record how it went for routing.
+
+    Returns the results that match the query, best first (empty if none
+    did), or None if the request failed or was cancelled (see lookup_hedged()).
+    """
+    started = time.perf_counter()
+    try:
+        with metrics.timer("search", provider=provider):
+            response = http_client.get(url, params=params, limiter=limiter, cancel=cancel)
+    except RequestCancelled:
+        # Another provider answered first; this says nothing about this one's health
+        logger.debug("Gave up on %s search for '%s'", PROVIDER_LABELS[provider], query)
+        return None
+    except requests.RequestException as e:
+        # Out of retries; let the next provider have a go rather than failing the book
+        return ranked_provider_results(provider, query, time.perf_counter() - started, None, e)
+    return ranked_provider_results(provider, query, time.perf_counter() - started, response)
+
+def ranked_provider_results(provider, query, elapsed, response, error=None):
+    """Record a provider's answer for routing and rank its results (see provider_search())."""
+    if error is None and response.status_code != 200:
+        error = response.status_code
+    if error is not None:
+        provider_router.record(provider, query_kind(query), elapsed, "error")
+        metrics.inc("search_errors", provider=provider)
+        logger.warning("Error searching %s: %s", PROVIDER_LABELS[provider], error)
         return None
     
-    volume_info = items[0].get("volumeInfo", {})
+    results_key, describe = PROVIDER_RESULTS[provider]
+    results = rank_results(query, response.json().get(results_key, []), describe, MATCH_MIN_SCORE)
+    provider_router.record(provider, query_kind(query), elapsed, "hit" if results else "miss")
+    return results
+
+def cached_lookup(provider, query):
+    """Check the lookup cache; returns (found, book data) like LookupCache.get()."""
+    if not lookup_cache:
+        return False, None
+    found, cached = lookup_cache.get(provider, query)
+    metrics.inc("lookup_cache", provider=provider, result="hit" if found else "miss")
+    if found:
+        logger.debug("Using cached %s result for '%s'", PROVIDER_LABELS[provider], query)
+    return found, cached
+
+def cache_lookup(provider, query, book_data):
+    if lookup_cache:
+        lookup_cache.set(provider, query, book_data)
+    return book_data
+
+def google_books_params(query):
+    params = {"q": query, "maxResults": SEARCH_CANDIDATES}
+    if FIELD_PROJECTION:
+        params["fields"] = GOOGLE_BOOKS_FIELDS
+    return params
+
+def open_library_params(query):
+    params = {"q": query, "limit": SEARCH_CANDIDATES}
+    if FIELD_PROJECTION:
+        params["fields"] = OPEN_LIBRARY_FIELDS
+    return params
+
+def search_google_books(query, cancel=None):
+    """Search for book information using Google Books API."""
+    if engine:
+        return engine.run(engine.search_google_books(query))
+    found, cached = cached_lookup("google_books", query)
+    if found:
+        return cached
+    
+    items = provider_search("google_books", query, GOOGLE_BOOKS_API_URL, google_books_params(query),
+                            google_books_limiter, cancel)
+    if items is None:
+        return None
+    return cache_lookup("google_books", query, parse_google_volume(items[0], query) if items else None)
+
+def parse_google_volume(item, query):
+    """Turn a Google Books volume into a BookRecord."""
+    volume_info = item.get("volumeInfo", {})
     
     # Get ISBN from industry identifiers
     isbn = None
@@ -196,74 +728,10 @@ def search_google_books(query):
             except ValueError:
                 published_date = None
     
-    # Determine fiction/non-fiction status based on categories
-    categories = volume_info.get("categories", [])
-    fiction_status = None
-    non_fiction_keywords = ["non-fiction", "nonfiction", "biography", "history", 
-                           "science", "self-help", "business", "psychology", 
-                           "philosophy", "politics"]
-    
-    fiction_keywords = ["fiction", "novel", "fantasy", "sci-fi", "science fiction", 
-                       "thriller", "mystery", "romance"]
-    
-    # Check categories for non-fiction or fiction keywords
-    for category in categories:
-        category_lower = category.lower()
-        
-        # Check for explicit non-fiction
-        if any(keyword in category_lower for keyword in non_fiction_keywords):
-            fiction_status = "Nonfiction"
-            break
-            
-        # Check for fiction
-        if any(keyword in category_lower for keyword in fiction_keywords):
-            fiction_status = "Fiction"
-            break
-    
-    # If still not determined, make a guess based on other factors
-    if fiction_status is None:
-        if "fiction" in query.lower():
-            fiction_status = "Fiction"
-        elif "non-fiction" in query.lower() or "nonfiction" in query.lower():
-            fiction_status = "Nonfiction"
-        else:
-            # Default to fiction if unknown
-            fiction_status = "Fiction"
-    
-    # Extract series information from title or subtitle
-    series_name = None
+    # Determine fiction/non-fiction status and series from categories, title and subtitle
+    fiction_status = classify_fiction(volume_info.get("categories", []), query)
     title = volume_info.get("title", "")
-    subtitle = volume_info.get("subtitle", "")
-    
-    # Common series patterns in titles
-    series_patterns = [
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Series(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Trilogy(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Saga(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Chronicles(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Sequence(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Duology(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Quartet(?:\s|$)",
-        r"Book\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
-        r"Volume\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
-        r"\((?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\)",
-        r"\[(?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\]",
-    ]
-    
-    # Check title and subtitle for series information
-    for pattern in series_patterns:
-        # Check in title
-        match = re.search(pattern, title, re.IGNORECASE)
-        if match:
-            series_name = match.group(1).strip()
-            break
-            
-        # Check in subtitle if available
-        if subtitle:
-            match = re.search(pattern, subtitle, re.IGNORECASE)
-            if match:
-                series_name = match.group(1).strip()
-                break
+    series_name = extract_series(title, volume_info.get("subtitle", ""))
     
     # Get a better quality cover image if available
     image_link = ""
@@ -275,38 +743,37 @@ def search_google_books(query):
                 image_link = image_links[img_type]
                 break
     
-    return {
-        "title": title,
-        "authors": volume_info.get("authors", []),
-        "description": volume_info.get("description", ""),
-        "categories": volume_info.get("categories", []),
-        "rating": volume_info.get("averageRating", 0),
-        "page_count": volume_info.get("pageCount", 0),
-        "info_link": volume_info.get("infoLink", ""),
-        "image_link": image_link,
-        "published_date": published_date,
-        "fiction_status": fiction_status,
-        "series_name": series_name,
-        "isbn": isbn  # Added ISBN to return data
-    }
+    return BookRecord(
+        title=title,
+        authors=volume_info.get("authors", []),
+        description=volume_info.get("description", ""),
+        categories=volume_info.get("categories", []),
+        rating=volume_info.get("averageRating", 0),
+        page_count=volume_info.get("pageCount", 0),
+        info_link=volume_info.get("infoLink", ""),
+        image_link=image_link,
+        published_date=published_date,
+        fiction_status=fiction_status,
+        series_name=series_name,
+        isbn=isbn
+    )
 
-def search_open_library(query):
+def search_open_library(query, cancel=None):
     """Search for book information using Open Library API."""
-    params = {"q": query, "limit": 1}
-    response = requests.get(OPEN_LIBRARY_API_URL, params=params)
-    
-    if response.status_code != 200:
-        print(f"Error searching Open Library: {response.status_code}")
-        return None
+    if engine:
+        return engine.run(engine.search_open_library(query))
+    found, cached = cached_lookup("open_library", query)
+    if found:
+        return cached
     
-    data = response.json()
-    docs = data.get("docs", [])
-    
-    if not docs:
+    docs = provider_search("open_library", query, OPEN_LIBRARY_API_URL, open_library_params(query),
+                           open_library_limiter, cancel)
+    if docs is None:
         return None
-    
-    book = docs[0]
-    
+    return cache_lookup("open_library", query, parse_open_library_doc(docs[0], query) if docs else None)
+
+def parse_open_library_doc(book, query):
+    """Turn an Open Library search doc into a BookRecord."""
     # Get ISBN from Open Library data
     isbn = None
     if "isbn" in book:
@@ -329,65 +796,11 @@ def search_open_library(query):
             published_date = {"start": f"{year}-01-01"}
     
     # Determine fiction/non-fiction status based on subjects
-    subjects = book.get("subject", [])
-    fiction_status = None
-    
-    non_fiction_keywords = ["non-fiction", "nonfiction", "biography", "history", 
-                           "science", "self-help", "business", "psychology", 
-                           "philosophy", "politics"]
+    fiction_status = classify_fiction(book.get("subject", []), query)
     
-    fiction_keywords = ["fiction", "novel", "fantasy", "sci-fi", "science fiction", 
-                       "thriller", "mystery", "romance"]
-    
-    # Check subjects for non-fiction or fiction keywords
-    for subject in subjects:
-        subject_lower = subject.lower()
-        
-        # Check for explicit non-fiction
-        if any(keyword in subject_lower for keyword in non_fiction_keywords):
-            fiction_status = "Nonfiction"
-            break
-            
-        # Check for fiction
-        if any(keyword in subject_lower for keyword in fiction_keywords):
-            fiction_status = "Fiction"
-            break
-    
-    # If still not determined, make a guess based on other factors
-    if fiction_status is None:
-        if "fiction" in query.lower():
-            fiction_status = "Fiction"
-        elif "non-fiction" in query.lower() or "nonfiction" in query.lower():
-            fiction_status = "Nonfiction"
-        else:
-            # Default to fiction if unknown
-            fiction_status = "Fiction"
-    
-    # Extract series information
-    series_name = None
+    # Extract series information from the title
     title = book.get("title", "")
-    
-    # Check if series information is in the title
-    series_patterns = [
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Series(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Trilogy(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Saga(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Chronicles(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Sequence(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Duology(?:\s|$)",
-        r"(?:^|\s)(?:The\s)?(.*?)\s+Quartet(?:\s|$)",
-        r"Book\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
-        r"Volume\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
-        r"\((?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\)",
-        r"\[(?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\]",
-    ]
-    
-    # Check title for series information
-    for pattern in series_patterns:
-        match = re.search(pattern, title, re.IGNORECASE)
-        if match:
-            series_name = match.group(1).strip()
-            break
+    series_name = extract_series(title)
     
     # If not in title, check if there's a series field
     if not series_name and "series" in book:
@@ -395,33 +808,136 @@ def search_open_library(query):
         if series_list and len(series_list) > 0:
             series_name = series_list[0]
     
-    return {
-        "title": title,
-        "authors": book.get("author_name", []),
-        "description": book.get("description", ""),
-        "categories": book.get("subject", []),
-        "rating": 0,
-        "page_count": book.get("number_of_pages_median", 0),
-        "info_link": f"https://openlibrary.org{book.get('key', '')}" if "key" in book else "",
-        "image_link": f"https://covers.openlibrary.org/b/id/{book.get('cover_i', '')}-L.jpg" if "cover_i" in book else "",
-        "published_date": published_date,
-        "fiction_status": fiction_status,
-        "series_name": series_name,
-        "isbn": isbn  # Added ISBN to return data
+    return BookRecord(
+        title=title,
+        authors=book.get("author_name", []),
+        description=book.get("description", ""),
+        categories=book.get("subject", []),
+        rating=0,
+        page_count=book.get("number_of_pages_median", 0),
+        info_link=f"https://openlibrary.org{book.get('key', '')}" if "key" in book else "",
+        image_link=f"https://covers.openlibrary.org/b/id/{book.get('cover_i', '')}-L.jpg" if "cover_i" in book else "",
+        published_date=published_date,
+        fiction_status=fiction_status,
+        series_name=series_name,
+        isbn=isbn
+    )
+
+PROVIDER_SEARCHES = {"google_books": search_google_books, "open_library": search_open_library}
+
+def resolve_isbn_batch(isbns):
+    """Resolve many ISBNs with a single Open Library search.
+
+    Returns a dict of ISBN -> book data for the ISBNs that were found.
+    Each result is also cached under the same key a per-item
+    `search_open_library("isbn:...")` call would use. If the request
+    fails, nothing is resolved and every book falls back to its own lookup.
+    """
+    if engine:
+        return engine.run(engine.resolve_isbn_batch(isbns))
+    wanted = {isbn.upper() for isbn in isbns}
+    started = time.perf_counter()
+    try:
+        with metrics.timer("search", provider="open_library_batch"):
+            response = http_client.get(OPEN_LIBRARY_API_URL, params=isbn_batch_params(wanted),
+                                       limiter=open_library_limiter)
+    except requests.RequestException as e:
+        return isbn_batch_failed(e, time.perf_counter() - started)
+    return resolved_isbn_batch(response, wanted, time.perf_counter() - started)
+
+def isbn_batch_failed(error, elapsed):
+    """Count a failed ISBN batch against Open Library's health; nothing is resolved."""
+    provider_router.record("open_library", "isbn", elapsed, "error")
+    metrics.inc("search_errors", provider="open_library_batch")
+    logger.warning("Error resolving ISBN batch with Open Library: %s", error)
+    return {}
+
+def isbn_batch_params(wanted):
+    params = {
+        "q": "isbn:(" + " OR ".join(sorted(wanted)) + ")",
+        # A work lists every edition's ISBN, so one doc can answer several ISBNs
+        "limit": len(wanted) * 2,
     }
+    if FIELD_PROJECTION:
+        params["fields"] = OPEN_LIBRARY_FIELDS
+    return params
 
-def update_notion_page(page_id, book_data, original_title):
-    """Update a Notion page with book information."""
-    url = f"{NOTION_API_URL}/pages/{page_id}"
+def resolved_isbn_batch(response, wanted, elapsed):
+    """Pick the wanted ISBNs out of a batched Open Library search (see resolve_isbn_batch())."""
+    if response.status_code != 200:
+        return isbn_batch_failed(response.status_code, elapsed)
+    
+    data = response.json()
+    docs = data.get("docs", [])
+    resolved = {}
+    for doc in docs:
+        for isbn in doc.get("isbn", []):
+            isbn = isbn.upper()
+            if isbn in wanted and isbn not in resolved:
+                book_data = parse_open_library_doc(doc, f"isbn:{isbn}")
+                book_data.isbn = isbn
+                resolved[isbn] = book_data
+    
+    if lookup_cache:
+        # Only cache misses when the result set was complete, not truncated by the limit
+        complete = data.get("numFound", len(docs)) <= len(docs)
+        for isbn in wanted:
+            if isbn in resolved:
+                lookup_cache.set("open_library", f"isbn:{isbn}", resolved[isbn])
+            elif complete:
+                lookup_cache.set("open_library", f"isbn:{isbn}", None)
+    
+    logger.info("Resolved %d of %d ISBNs with one Open Library request", len(resolved), len(wanted))
+    return resolved
+
+def batch_isbn_lookups(book_iter):
+    """Pass books through, resolving ISBN books in batches along the way.
+
+    Title searches are yielded straight away. ISBN books are held until a
+    batch fills up (or the scan ends), resolved together, and yielded with
+    their result attached as `book_data`. Books the batch could not resolve
+    are yielded without it and fall back to the per-item lookup.
+    """
+    pending = []
+    
+    def flush():
+        resolved = resolve_isbn_batch([book.search_query[len("isbn:"):] for book in pending])
+        for book in pending:
+            book_data = resolved.get(book.search_query[len("isbn:"):].upper())
+            if book_data:
+                book.book_data = book_data
+            yield book
+        pending.clear()
+    
+    for book in book_iter:
+        if not book.is_isbn:
+            yield book
+            continue
+        if local_index:
+            # No point batching a remote request for what the local index knows
+            book_data = search_local_index(book.search_query)
+            if book_data:
+                book.book_data = book_data
+                yield book
+                continue
+        pending.append(book)
+        if len(pending) >= ISBN_BATCH_SIZE:
+            yield from flush()
+    if pending:
+        yield from flush()
+
+def build_page_data(book_data, original_title, tenant=None):
+    """Build the properties, cover and icon to write for a book."""
+    tenant = get_tenant(tenant)
     
     # Prepare authors property - checking if authors exist in the database options
     authors_property = {
-        "multi_select": [{"name": author} for author in book_data.get("authors", [])]
+        "multi_select": [{"name": author} for author in book_data.authors]
     }
     
     # Prepare categories/genres property
     genres_property = {
-        "multi_select": [{"name": category} for category in book_data.get("categories", [])][:10]  # Notion has limits
+        "multi_select": [{"name": category} for category in book_data.categories][:10]  # Notion has limits
     }
     
     # Prepare properties update
@@ -430,7 +946,7 @@ def update_notion_page(page_id, book_data, original_title):
             "title": [
                 {
                     "text": {
-                        "content": book_data.get("title", "")
+                        "content": book_data.title
                     }
                 }
             ]
@@ -439,7 +955,7 @@ def update_notion_page(page_id, book_data, original_title):
             "rich_text": [
                 {
                     "text": {
-                        "content": book_data.get("description", "")[:2000] if book_data.get("description") else ""
+                        "content": book_data.description[:2000] if book_data.description else ""
                     }
                 }
             ]
@@ -447,7 +963,7 @@ def update_notion_page(page_id, book_data, original_title):
         PROPERTY_AUTHORS: authors_property,
         PROPERTY_GENRES: genres_property,
         PROPERTY_LINK: {
-            "url": book_data.get("info_link", "")
+            "url": book_data.info_link
         },
         PROPERTY_SEARCH_TERM: {
             "rich_text": [
@@ -461,52 +977,50 @@ def update_notion_page(page_id, book_data, original_title):
     }
     
     # Add cover image URL if available
-    if book_data.get("image_link"):
-        print("Adding cover image URL to properties...")
+    if book_data.image_link:
         properties[PROPERTY_COVER] = {
-            "url": book_data.get("image_link", "")
+            "url": book_data.image_link
         }
     
     # Add rating if available
-    if book_data.get("rating", 0) > 0:
+    if book_data.rating > 0:
         properties[PROPERTY_RATING] = {
-            "number": book_data.get("rating", 0)
+            "number": book_data.rating
         }
     
     # Add page count if available
-    if book_data.get("page_count", 0) > 0:
+    if book_data.page_count > 0:
         properties[PROPERTY_PAGES] = {
-            "number": book_data.get("page_count", 0)
+            "number": book_data.page_count
         }
     
     # Add published date if available
-    if book_data.get("published_date"):
+    if book_data.published_date:
         properties[PROPERTY_DATE_PUBLISHED] = {
-            "date": book_data.get("published_date")
+            "date": book_data.published_date
         }
     
     # Add fiction/non-fiction status if available
-    if book_data.get("fiction_status"):
+    if book_data.fiction_status:
         properties[PROPERTY_NON_FICTION] = {
             "select": {
-                "name": book_data.get("fiction_status")
+                "name": book_data.fiction_status
             }
         }
     
     # Add series if available
-    if book_data.get("series_name"):
+    if book_data.series_name:
         properties[PROPERTY_SERIES] = {
-            "multi_select": [{"name": book_data.get("series_name")}]
+            "multi_select": [{"name": book_data.series_name}]
         }
     
     # Add ISBN if available
-    if book_data.get("isbn"):
-        print("Adding ISBN to properties...")
+    if book_data.isbn:
         properties[PROPERTY_ISBN] = {
             "rich_text": [
                 {
                     "text": {
-                        "content": book_data.get("isbn", "")
+                        "content": book_data.isbn
                     }
                 }
             ]
@@ -518,125 +1032,583 @@ def update_notion_page(page_id, book_data, original_title):
     }
     
     # Add cover and icon if image is available
-    if book_data.get("image_link"):
-        print("Setting page cover and icon...")
-        print(f"Using image URL: {book_data.get('image_link')}")
+    if book_data.image_link:
         data["cover"] = {
             "type": "external",
             "external": {
-                "url": book_data.get("image_link")
+                "url": book_data.image_link
             }
         }
         data["icon"] = {
             "type": "external",
             "external": {
-                "url": book_data.get("image_link")
+                "url": book_data.image_link
             }
         }
-        print("Page cover and icon set successfully")
     
-    print("Sending update request to Notion...")
-    print(f"Request URL: {url}")
-    print(f"Request headers: {notion_headers}")
-    print(f"Request data: {json.dumps(data, indent=2)}")
+    if SCHEMA_VALIDATION:
+        # Map names and types to the real columns so a mismatch doesn't sink the whole update
+        data["properties"] = validate_properties(data["properties"], tenant.schema)
+    
+    return data
+
+def update_notion_page(page_id, book_data, original_title, current=None, tenant=None):
+    """Update a Notion page with book information.
+
+    If `current` (a snapshot_page() of the page) is given, only values that
+    differ from it are sent, and the PATCH is skipped if nothing changed.
+    """
+    if engine:
+        return engine.run(engine.update_notion_page(page_id, book_data, original_title, current, tenant))
+    tenant = get_tenant(tenant)
+    data = page_update_payload(page_id, book_data, original_title, current, tenant)
+    if data is None:
+        return True
+    
+    try:
+        with metrics.timer("stage", stage="notion_patch"):
+            response = http_client.patch(f"{NOTION_API_URL}/pages/{page_id}", headers=tenant.headers, json=data,
+                                         limiter=tenant.limiter)
+    except requests.RequestException as e:
+        return page_update_failed(page_id, e)
+    return page_updated(page_id, response, tenant)
+
+def page_update_failed(page_id, error):
+    """Record a PATCH that got no response even after retries; the book counts as update_failed."""
+    metrics.inc("notion_patch_errors")
+    logger.error("Error updating page %s: %s", page_id, error)
+    return False
+
+def page_update_payload(page_id, book_data, original_title, current, tenant):
+    """Build the PATCH body for a page, or return None if it's already up to date."""
+    data = build_page_data(book_data, original_title, tenant)
+    
+    if current is not None:
+        full_size = len(data["properties"]) + ("cover" in data) + ("icon" in data)
+        data = diff_page_update(data, current)
+        if not data:
+            metrics.inc("notion_patch_skipped")
+            logger.debug("Page %s already up to date, skipping update", page_id)
+            return None
+        logger.debug("Sending %d of %d fields for page %s",
+                     len(data.get("properties", {})) + ("cover" in data) + ("icon" in data), full_size, page_id)
     
-    response = requests.patch(url, headers=notion_headers, json=data)
+    # Formatting the payload is only worth it when someone will read it
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Updating page %s with: %s", page_id, json.dumps(data, indent=2))
+    return data
+
+def page_updated(page_id, response, tenant):
+    """Check the response to a page PATCH; True if Notion accepted it."""
     if response.status_code != 200:
-        print(f"Error updating page: {response.status_code}")
-        print(f"Error response: {response.text}")
-        print(f"Request data that failed: {json.dumps(data, indent=2)}")
+        metrics.inc("notion_patch_errors")
+        logger.error("Error updating page %s: %s %s", page_id, response.status_code, response.text)
+        if response.status_code == 400 and SCHEMA_VALIDATION:
+            # The database may have changed since the schema was cached
+            tenant.schema.invalidate()
         return False
     
-    print("Page updated successfully")
+    logger.debug("Page %s updated successfully", page_id)
     return True
 
-def process_books():
-    """Find books with semicolons and update them with metadata."""
-    print("Starting to process books with semicolons in their titles")
-    books = find_books_with_semicolon()
-    
-    if not books:
-        print("No books found with titles ending in semicolons")
-        return []
+def bare_page_data(original_title, tenant=None):
+    """Build a page with just the search text, for a book that wasn't found."""
+    tenant = get_tenant(tenant)
+    # No trailing ";", so polling leaves it alone until someone edits the title
+    data = {
+        "properties": {
+            PROPERTY_TITLE: {"title": [{"text": {"content": original_title}}]},
+            PROPERTY_SEARCH_TERM: {"rich_text": [{"text": {"content": original_title}}]},
+        }
+    }
+    if SCHEMA_VALIDATION:
+        data["properties"] = validate_properties(data["properties"], tenant.schema)
+    return data
+
+def create_notion_page(book_data, original_title, tenant=None):
+    """Create a new page in the database for a book.
+
+    With no `book_data`, the page only gets the search text. Returns the
+    new page's ID, or None if Notion rejected it.
+    """
+    if engine:
+        return engine.run(engine.create_notion_page(book_data, original_title, tenant))
+    tenant = get_tenant(tenant)
+    if book_data:
+        data = build_page_data(book_data, original_title, tenant)
+    else:
+        data = bare_page_data(original_title, tenant)
+    data["parent"] = {"database_id": tenant.database_id}
+
+    # Not retried after a timeout or 5xx: the page may exist by then, and a retry would duplicate it
+    try:
+        with metrics.timer("stage", stage="notion_create"):
+            response = http_client.post(f"{NOTION_API_URL}/pages", headers=tenant.headers, json=data,
+                                        limiter=tenant.limiter, idempotent=False)
+    except requests.RequestException as e:
+        return page_create_failed(original_title, e)
+    return page_created(original_title, response, tenant)
+
+def page_create_failed(original_title, error):
+    """Record a page creation that got no response; the page may or may not exist."""
+    metrics.inc("notion_create_errors")
+    logger.error("Error creating page for '%s' (it may have been created anyway): %s", original_title, error)
+    return None
+
+def page_created(original_title, response, tenant):
+    """Check the response to a page creation; returns the new page's ID or None."""
+    if response.status_code != 200:
+        metrics.inc("notion_create_errors")
+        logger.error("Error creating page for '%s': %s %s", original_title, response.status_code, response.text)
+        if response.status_code == 400 and SCHEMA_VALIDATION:
+            tenant.schema.invalidate()
+        return None
+
+    page_id = response.json().get("id")
+    logger.debug("Created page %s for '%s'", page_id, original_title)
+    return page_id
+
+def update_sync_state(sync_state, scan_started, full_scan, tenant=None):
+    """Advance the sync watermark to the start of a completed scan."""
+    sync_state["watermark"] = format_notion_timestamp(scan_started)
+    if full_scan:
+        sync_state["last_full_sync"] = time.time()
+    save_sync_state(sync_state, tenant)
+
+def lookup_plan(book):
+    """List the (search function, query) attempts for a book in preference order.
+
+    Providers are ordered by the router, which leaves out any whose
+    circuit is open. Each search ranks several candidates itself, so one
+    query per provider is enough.
+    """
+    query = book.search_query
+    return [(PROVIDER_SEARCHES[provider], query) for provider in provider_router.order(query_kind(query))]
+
+def lookup_sequential(attempts):
+    """Try each attempt in turn and return the first result found."""
+    for search, query in attempts:
+        logger.debug("Searching %s for: %s", search.__name__, query)
+        book_data = search(query)
+        if book_data:
+            return book_data
+    return None
+
+def settled_result(futures):
+    """(book data, settled) for started attempts, taking results in preference order.
+
+    `settled` is True once the answer can't change: an attempt found the
+    book and every earlier one came back empty, or all of them did.
+    """
+    for future in futures:
+        if not future.done():
+            return None, False
+        book_data = future.result()
+        if book_data:
+            return book_data, True
+    return None, True
+
+def lookup_hedged(attempts):
+    """Start the preferred attempt, and the next one whenever HEDGE_DELAY passes without an answer.
+
+    Results are taken in preference order, so a later attempt only wins
+    when every earlier one came back empty. Once an answer is known,
+    attempts not started yet are dropped and ones still waiting for their
+    rate limiter give up; a request already sent is ignored.
+    """
+    cancel = threading.Event()
+    futures = []
+    try:
+        for search, query in attempts:
+            futures.append(lookup_executor.submit(search, query, cancel=cancel))
+            deadline = time.monotonic() + HEDGE_DELAY
+            while True:
+                book_data, settled = settled_result(futures)
+                if book_data:
+                    return book_data
+                remaining = deadline - time.monotonic()
+                if settled or remaining <= 0:
+                    break
+                wait([future for future in futures if not future.done()], timeout=remaining,
+                     return_when=FIRST_COMPLETED)
+        for future in futures:
+            book_data = future.result()
+            if book_data:
+                return book_data
+        return None
+    finally:
+        cancel.set()
+        for future in futures:
+            future.cancel()
+
+def lookup_book(book):
+    """Find metadata for a book using the configured lookup strategy."""
+    if engine:
+        return engine.run(engine.lookup_book(book))
+    if local_index:
+        # Answered locally in well under a millisecond, so it goes first on its own
+        book_data = search_local_index(book.search_query)
+        if book_data:
+            return book_data
     
-    print(f"Found {len(books)} books with semicolon titles to process")
+    attempts = lookup_plan(book)
+    if not attempts:
+        logger.warning("Every book provider is unavailable, skipping '%s' for now", book.search_query)
+        return None
+    if not HEDGED_LOOKUP:
+        return lookup_sequential(attempts)
     
-    for book in books:
-        print(f"Processing book: {book['search_query']}")
-        book_data = None
-        
-        # If it's an ISBN, try a direct ISBN search first
-        if book.get("is_isbn", False):
-            # Try Google Books with ISBN search
-            print(f"Searching by ISBN: {book['search_query']}")
-            book_data = search_google_books(book["search_query"])
-            
-            # If Google Books fails, try Open Library with ISBN
-            if not book_data:
-                print("No results from Google Books for ISBN, trying Open Library...")
-                book_data = search_open_library(book["search_query"])
-        else:
-            # Try Google Books first for title search
-            print(f"Searching by title: {book['search_query']}")
-            book_data = search_google_books(book["search_query"])
-            
-            # If Google Books fails, try Open Library
-            if not book_data:
-                print("No results from Google Books, trying Open Library...")
-                book_data = search_open_library(book["search_query"])
-            
-            # If both fail, try adding 'book' to the search query
-            if not book_data:
-                modified_query = f"{book['search_query']} book"
-                print(f"No results, trying with 'book' keyword added: {modified_query}")
-                book_data = search_google_books(modified_query)
-                
-                if not book_data:
-                    print("Still no results from Google Books with modified query, trying Open Library...")
-                    book_data = search_open_library(modified_query)
+    logger.debug("Hedged lookup for: %s", book.search_query)
+    return lookup_hedged(attempts)
+
+def process_book(book):
+    """Look up metadata for a single book and update its Notion page."""
+    if engine:
+        return engine.run(engine.process_book(book))
+    tenant = get_tenant(book.tenant)
+    logger.debug("Processing book: %s", book.search_query)
+    try:
+        # Let go of a batch-resolved result once it's been picked up
+        book_data, book.book_data = book.book_data, None
+        if not book_data:
+            with metrics.timer("stage", stage="lookup"):
+                book_data = lookup_book(book)
         
         # If we found book data, update the Notion page
+        success = False
         if book_data:
-            print(f"Found book info for '{book_data['title']}', updating Notion...")
-            success = update_notion_page(book["id"], book_data, book["title"])
-            if success:
-                print("Successfully updated Notion page")
-            else:
-                print("Failed to update Notion page")
+            logger.debug("Found book info for '%s', updating Notion", book_data.title)
+            success = update_notion_page(book.id, book_data, book.title, book.current, tenant)
+        return record_book_outcome(book, book_data, success, tenant)
+    finally:
+        release_lease(book)
+
+def record_book_outcome(book, book_data, success, tenant):
+    """Log, count and ledger one book's result; returns `success`."""
+    if book_data:
+        if success:
+            outcome = "updated"
+            logger.info("Updated '%s' from search '%s'", book_data.title, book.search_query)
+        else:
+            outcome = "update_failed"
+            logger.warning("Failed to update Notion page for '%s'", book.search_query)
+    else:
+        outcome = "not_found"
+        logger.info("No book information found for '%s'", book.search_query)
+    
+    metrics.inc("books_processed", outcome=outcome, tenant=tenant.name)
+    if work_ledger:
+        work_ledger.record(tenant.name, book.id, book.search_query, outcome, success)
+    return success
+
+def skip_backed_off(book_iter):
+    """Drop books whose last attempt failed and whose retry isn't due yet."""
+    for book in book_iter:
+        if work_ledger.is_due(get_tenant(book.tenant).name, book.id, book.search_query):
+            yield book
+        else:
+            metrics.inc("books_skipped", reason="backoff")
+            logger.debug("Skipping '%s' until its retry is due", book.search_query)
+
+def lease_book(book):
+    """Claim a book's page for this worker; False if another worker is responsible for it."""
+    tenant = get_tenant(book.tenant)
+    result = lease_store.claim(tenant.name, book.id)
+    if result in ("other_shard", "leased"):
+        metrics.inc("books_skipped", reason=result)
+        logger.debug("Skipping '%s', another worker has it (%s)", book.search_query, result)
+        return False
+    if result == "taken_over":
+        metrics.inc("lease_takeovers", tenant=tenant.name)
+        logger.debug("Taking over '%s' from a worker that stopped", book.search_query)
+    return True
+
+def release_lease(book):
+    """Give up this worker's lease on a book's page, whether or not processing it worked."""
+    # Called after the ledger record, so whoever sees the page next also sees its backoff
+    if lease_store:
+        lease_store.release(get_tenant(book.tenant).name, book.id)
+
+def skip_leased(book_iter, leased):
+    """Drop books that belong to another worker's shard or are leased by another worker.
+
+    Books this worker claims are added to `leased` until they are processed.
+    """
+    for book in book_iter:
+        if lease_book(book):
+            leased.add(book)
+            yield book
+
+# Shares the book workers between tenants so one busy database can't starve the rest
+scheduler = FairScheduler(PROCESS_CONCURRENCY)
+
+def run_books(sources):
+    """Process each tenant's books, sharing the workers fairly between tenants.
+
+    `sources` maps a tenant to an iterator of its books. Books still backing
+    off after a failure are skipped, as are books another worker is
+    responsible for, and ISBN books are resolved in batches first if
+    enabled. Returns a dict of tenant -> Lane
+    with the books seen, their outcomes and any error raised by the iterator.
+    With the async engine the iterators are the engine's async generators.
+    """
+    if engine:
+        return engine.run(engine.run_books(sources))
+    # Books claimed but not yet picked up, e.g. waiting for an ISBN batch
+    leased = set()
+    if work_ledger:
+        sources = {tenant: skip_backed_off(book_iter) for tenant, book_iter in sources.items()}
+    if lease_store:
+        sources = {tenant: skip_leased(book_iter, leased) for tenant, book_iter in sources.items()}
+    if ISBN_BATCH_SIZE > 1:
+        sources = {tenant: batch_isbn_lookups(book_iter) for tenant, book_iter in sources.items()}
+    
+    def handle(book):
+        leased.discard(book)
+        # Looked up at call time so process_book can be wrapped (see benchmark.py)
+        return process_book(book)
+    
+    try:
+        return scheduler.run(sources, handle)
+    finally:
+        # An iterator that failed can leave claimed books behind; the heartbeat would keep them forever
+        for book in list(leased):
+            release_lease(book)
+
+def iter_books_from_pages(page_ids, tenant=None):
+    """Yield books for specific pages whose titles end in a semicolon."""
+    tenant = get_tenant(tenant)
+    for page_id in page_ids:
+        page = get_page(page_id, tenant)
+        if page is None:
+            continue
+        if not in_tenant_database(page, tenant):
+            metrics.inc("books_skipped", reason="other_database")
+            logger.warning("Page %s is not in the %s database, skipping", page_id, tenant.name)
+            continue
+        book = extract_book({**page, "id": page_id}, tenant)
+        if book:
+            yield book
         else:
-            print(f"No book information found for '{book['search_query']}'")
+            logger.debug("Page %s does not end in a semicolon, skipping", page_id)
+
+def process_pages(pages):
+    """Process only the given pages instead of scanning the databases.
+
+    `pages` maps a tenant to the IDs of its pages to process.
+    """
+    logger.info("Processing %d page(s) named by webhook events", sum(len(page_ids) for page_ids in pages.values()))
+    source = engine.iter_books_from_pages if engine else iter_books_from_pages
+    lanes = run_books({tenant: source(page_ids, tenant) for tenant, page_ids in pages.items()})
+    books = []
+    for lane in lanes.values():
+        logger.info("Updated %d of %d targeted books for %s", sum(lane.results), len(lane.items), lane.key.name)
+        books.extend(lane.items)
+    return books
+
+def process_books(selected=None):
+    """Find books with semicolons and update them with metadata.
+
+    Every configured tenant is scanned unless `selected` lists the tenants
+    to scan. A tenant whose query fails keeps its previous sync watermark
+    without holding up the others.
+    """
+    logger.info("Starting to process books with semicolons in their titles")
+    
+    scan = engine.iter_books_with_semicolon if engine else iter_books_with_semicolon
+    sources = {}
+    scans = {}
+    for tenant in selected or tenants:
+        # Only look at recently edited pages unless a full scan is due
+        sync_state = load_sync_state(tenant) if INCREMENTAL_SYNC else {}
+        since = None
+        if sync_state.get("watermark") and time.time() - sync_state.get("last_full_sync", 0) < FULL_SYNC_INTERVAL:
+            since = sync_state["watermark"]
+        scans[tenant] = (sync_state, datetime.utcnow(), since)
+        sources[tenant] = scan(since, tenant)
+    
+    lanes = run_books(sources)
+    
+    books = []
+    errors = []
+    for tenant, lane in lanes.items():
+        books.extend(lane.items)
+        if isinstance(lane.error, QueryFailed):
+            logger.error("Database query failed for %s, keeping the previous sync watermark", tenant.name)
+            continue
+        if lane.error is not None:
+            errors.append(lane.error)
+            continue
+        
+        if not lane.items:
+            logger.info("No books found with titles ending in semicolons for %s", tenant.name)
+        else:
+            logger.info("Updated %d of %d books with semicolon titles for %s",
+                        sum(lane.results), len(lane.items), tenant.name)
+        
+        if INCREMENTAL_SYNC:
+            sync_state, scan_started, since = scans[tenant]
+            update_sync_state(sync_state, scan_started, since is None, tenant)
+    
+    if lookup_cache:
+        stats = lookup_cache.stats()
+        logger.info("Lookup cache: %d hits, %d misses, %d/%d entries",
+                    stats["hits"], stats["misses"], stats["entries"], stats["max_entries"])
     
+    if work_ledger:
+        stats = work_ledger.stats()
+        logger.info("Work ledger: %d book(s) backing off, %d skipped so far",
+                    stats["waiting"], stats["skipped"])
+    
+    if errors:
+        raise errors[0]
     return books
 
+def run_job(job):
+    """Run a queued processing job and summarize the result."""
+    logger.info("Running job %d for %d trigger(s): %s", job.id, len(job.triggers), ", ".join(job.triggers))
+    books = []
+    if job.page_ids:
+        books.extend(process_pages({
+            tenants_by_name[name]: sorted(page_ids)
+            for name, page_ids in job.page_ids.items()
+            if name in tenants_by_name
+        }))
+    if job.scan_database:
+        selected = None
+        if job.scan_tenants is not None:
+            selected = [tenant for tenant in tenants if tenant.name in job.scan_tenants]
+        if selected is None or selected:
+            books.extend(process_books(selected))
+    return {
+        "books": len(books),
+        "pages": sum(len(page_ids) for page_ids in job.page_ids.values()),
+        "scan_database": job.scan_database,
+    }
+
+job_queue = JobQueue(run_job, background=BACKGROUND_JOBS)
+
+def extract_page_ids(payload):
+    """Pull the IDs of changed pages out of a webhook body.
+
+    Understands Notion webhook events (`{"entity": {"type": "page", "id": ...}}`),
+    lists of such events under `events`, and plain `page_id` / `page_ids` fields.
+    """
+    if not isinstance(payload, dict):
+        return set()
+    
+    page_ids = set()
+    events = payload.get("events") if isinstance(payload.get("events"), list) else [payload]
+    for event in events:
+        if not isinstance(event, dict):
+            continue
+        entity = event.get("entity") or {}
+        if isinstance(entity, dict) and entity.get("type") == "page" and entity.get("id"):
+            page_ids.add(entity["id"])
+        if event.get("page_id"):
+            page_ids.add(event["page_id"])
+        if isinstance(event.get("page_ids"), list):
+            page_ids.update(page_id for page_id in event["page_ids"] if page_id)
+    return page_ids
+
+def job_accepted(job):
+    """Build the 202 response for a queued job, or the 200 for one already run (BACKGROUND_JOBS off)."""
+    body = {
+        "success": job.status != "failed",
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/jobs/{job.id}"
+    }
+    if not job.done.is_set():
+        return jsonify(body), 202
+    body.update(result=job.result, error=job.error)
+    return jsonify(body), 200
+
 @app.route('/webhook', methods=['POST'])
-def webhook_handler():
-    """Handle Notion webhook requests."""
+@app.route('/webhook/<tenant_name>', methods=['POST'])
+def webhook_handler(tenant_name=None):
+    """Handle Notion webhook requests.
+
+    Each tenant's webhooks go to /webhook/<tenant name>; plain /webhook
+    belongs to the first configured tenant.
+    """
+    tenant = tenants_by_name.get(tenant_name) if tenant_name else get_tenant()
+    if tenant is None:
+        return jsonify({"error": "Unknown tenant"}), 404
+    
     # Basic security check (you might want to implement more robust security)
     token = request.headers.get('X-Notion-Token')
-    if not token or token != os.getenv("WEBHOOK_SECRET"):
+    if not token or token != (tenant.webhook_secret or os.getenv("WEBHOOK_SECRET")):
         return jsonify({"error": "Unauthorized"}), 401
     
-    # Process the books immediately when triggered by a webhook
-    process_books()
-    return jsonify({"success": True})
+    # Events that name pages only need those pages processed; anything else
+    # falls back to a database scan. Either way the background worker does the work.
+    page_ids = extract_page_ids(request.get_json(silent=True))
+    if page_ids:
+        return job_accepted(job_queue.submit("webhook", page_ids=page_ids, tenant=tenant.name))
+    return job_accepted(job_queue.submit("webhook", scan_database=True, tenant=tenant.name))
 
 @app.route('/fetch', methods=['GET'])
 def fetch_handler():
     """Endpoint for scheduled triggers (e.g. from cron-job.org)."""
-    process_books()
-    return jsonify({"success": True})
+    return job_accepted(job_queue.submit("fetch", scan_database=True))
+
+@app.route('/jobs', methods=['GET'])
+def jobs_handler():
+    """List recent processing jobs."""
+    return jsonify({"jobs": [job.to_dict() for job in job_queue.jobs()]})
+
+@app.route('/jobs/<int:job_id>', methods=['GET'])
+def job_status_handler(job_id):
+    """Report the status of a processing job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/cache', methods=['GET'])
+def cache_stats_handler():
+    """Report lookup cache hit and miss counts."""
+    if not lookup_cache:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **lookup_cache.stats()})
+
+@app.route('/providers', methods=['GET'])
+def providers_handler():
+    """Report each book provider's circuit breaker state and recent health."""
+    return jsonify(provider_router.status())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_handler():
+    """Expose pipeline metrics in the Prometheus text format."""
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4"}
+
+def next_poll_interval(interval, books_found):
+    """Reset to the fastest interval after finding work, otherwise back off."""
+    if books_found:
+        return POLL_MIN_INTERVAL
+    return min(POLL_MAX_INTERVAL, max(POLL_MIN_INTERVAL, interval * POLL_BACKOFF_FACTOR))
 
 def start_polling():
-    """Start polling the database at regular intervals."""
+    """Poll the database on an adaptive schedule.
+
+    Runs go through the same job queue as the web endpoints. A cycle is
+    skipped if a previous run is still in progress.
+    """
+    interval = POLL_MIN_INTERVAL
     while True:
-        try:
-            print(f"Checking for new books ending with semicolons...")
-            process_books()
-        except Exception as e:
-            print(f"Error during processing: {e}")
+        if job_queue.busy():
+            logger.info("Previous run still in progress, skipping this poll")
+        else:
+            logger.info("Checking for new books ending with semicolons")
+            job = job_queue.submit("poll", scan_database=True)
+            if job.done.wait(timeout=POLL_MAX_INTERVAL):
+                books_found = job.result["books"] if job.status == "succeeded" else 0
+                interval = next_poll_interval(interval, books_found)
         
-        print(f"Sleeping for {CHECK_INTERVAL} seconds...")
-        time.sleep(CHECK_INTERVAL)
+        delay = interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+        logger.debug("Sleeping for %.1f seconds", delay)
+        time.sleep(delay)
 
 if __name__ == '__main__':
     # Check if running in web server mode or polling mode
@@ -0,0 +1,602 @@
+import asyncio
+import atexit
+import json
+import logging
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from http_client import RETRY_STATUS_CODES, UNSAFE_RETRY_STATUS_CODES
+from tenants import Lane
+
+logger = logging.getLogger("notion_books.async")
+
+class FetchedResponse:
+    """A fully read HTTP response, shaped like the parts of `requests.Response` app.py uses."""
+
+    __slots__ = ("status_code", "headers", "content")
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8", errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+def query_items(params):
+    """Flatten query parameters into pairs; a list value becomes a repeated key, as requests does."""
+    items = []
+    for key, value in (params or {}).items():
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            items.append((key, str(item)))
+    return items
+
+async def acquire_token(limiter):
+    """Wait for a token from a TokenBucket without blocking the event loop."""
+    while True:
+        wait = limiter.try_acquire()
+        if not wait:
+            return
+        await asyncio.sleep(wait)
+
+class AsyncHttpClient:
+    """aiohttp counterpart of HttpClient, with the same timeouts and retry policy.
+
+    `retry_policy` is the HttpClient whose timeout, retry count and
+    `retry_delay()` are used, so both engines back off the same way. At
+    most `host_connections` requests are in flight to any one host.
+    """
+
+    def __init__(self, retry_policy, host_connections=20, metrics=None):
+        self.retry_policy = retry_policy
+        self.host_connections = host_connections
+        self.metrics = metrics
+        self._session = None
+        self._host_slots = {}
+
+    def session(self):
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.retry_policy.timeout),
+                # The per-host semaphores are the limit
+                connector=aiohttp.TCPConnector(limit=0),
+            )
+        return self._session
+
+    def host_slots(self, host):
+        slots = self._host_slots.get(host)
+        if slots is None:
+            slots = self._host_slots[host] = asyncio.BoundedSemaphore(self.host_connections)
+        return slots
+
+    async def request(self, method, url, limiter=None, headers=None, params=None, json=None, idempotent=True):
+        """Send a request, retrying transient failures; see HttpClient.request()."""
+        host = urlsplit(url).netloc
+        retry_statuses = RETRY_STATUS_CODES if idempotent else UNSAFE_RETRY_STATUS_CODES
+        attempt = 0
+        while True:
+            if limiter:
+                await acquire_token(limiter)
+            try:
+                async with self.host_slots(host):
+                    async with self.session().request(method, url, headers=headers, params=query_items(params),
+                                                      json=json) as response:
+                        fetched = FetchedResponse(response.status, response.headers, await response.read())
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self._count(host, error=type(e).__name__)
+                attempt += 1
+                if attempt > self.retry_policy.max_retries or not idempotent:
+                    raise
+                delay = self.retry_policy.retry_delay(attempt)
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+                await asyncio.sleep(delay)
+                continue
+
+            self._count(host, fetched.status_code)
+            if fetched.status_code not in retry_statuses:
+                return fetched
+            attempt += 1
+            if attempt > self.retry_policy.max_retries:
+                return fetched
+            delay = self.retry_policy.retry_delay(attempt, fetched)
+            logger.warning("%s %s returned %s, retrying in %.1fs", method, url, fetched.status_code, delay)
+            await asyncio.sleep(delay)
+
+    def _count(self, host, status=None, error=None):
+        if not self.metrics:
+            return
+        if error:
+            # Transport errors never got a status code
+            self.metrics.inc("http_requests", host=host, error=error)
+        else:
+            self.metrics.inc("http_requests", host=host, status=status)
+
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+
+    async def patch(self, url, **kwargs):
+        return await self.request("PATCH", url, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+class TaskScope:
+    """Run child tasks that can't outlive the `async with` block that started them.
+
+    Leaving the block waits for every child. The first child to fail
+    cancels the others and the block's own body, and its exception is
+    raised from the block. `cancel()` stops the remaining children early.
+    This is asyncio.TaskGroup (Python 3.11) for the 3.9+ this project runs on.
+    """
+
+    def __init__(self):
+        self._tasks = set()
+        self._error = None
+        self._parent = None
+        self._exiting = False
+
+    async def __aenter__(self):
+        self._parent = asyncio.current_task()
+        return self
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._child_done)
+        return task
+
+    def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+
+    def _child_done(self, task):
+        self._tasks.discard(task)
+        if task.cancelled() or task.exception() is None or self._error is not None:
+            return
+        self._error = task.exception()
+        self.cancel()
+        if not self._exiting:
+            self._parent.cancel()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._exiting = True
+        if exc_type is not None:
+            self.cancel()
+        try:
+            while self._tasks:
+                await asyncio.wait(set(self._tasks))
+        except asyncio.CancelledError:
+            # Cancelled from outside while waiting: children go too, but are still waited for
+            self.cancel()
+            while self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            raise
+        if self._error is not None:
+            raise self._error
+        return False
+
+class AsyncEngine:
+    """Scan, look up and update with asyncio instead of worker threads.
+
+    The engine owns an event loop running in a background thread. app.py's
+    synchronous functions stay the entry points: when the engine is on they
+    hand their work to it with `run()`, which blocks the calling thread
+    (a Flask handler, the job worker, a bulk import worker) until the
+    coroutine finishes. Parsing, ranking, caching and page building are
+    shared with app.py; only the waiting is asynchronous. Anything that may
+    block runs in a thread so it can't stall the loop: building payloads
+    (which may fetch the database schema) and every SQLite call, i.e. the
+    lookup cache, work ledger, page leases and local index.
+
+    `shutdown()` (also registered with atexit) cancels every task still
+    running, so callers blocked in `run()` get CancelledError, then closes
+    the HTTP session and stops the loop.
+    """
+
+    def __init__(self, app, max_books=200, host_connections=20):
+        self.app = app
+        self.max_books = max_books
+        self.http = AsyncHttpClient(app.http_client, host_connections, app.metrics)
+        self.searches = {"google_books": self.search_google_books, "open_library": self.search_open_library}
+        self.loop = asyncio.new_event_loop()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run_loop, name="async-engine", daemon=True)
+        self._thread.start()
+        atexit.register(self.shutdown)
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, coro):
+        """Run a coroutine on the engine's loop and wait for its result."""
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("AsyncEngine.run() would block its own event loop; await the coroutine instead")
+        if self._closed:
+            coro.close()
+            raise RuntimeError("AsyncEngine has been shut down")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def shutdown(self, timeout=10):
+        """Cancel everything in flight, close connections and stop the loop."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+            if not self._thread.is_alive():
+                self.loop.close()
+
+    async def _shutdown(self):
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks() if task is not current]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if tasks:
+            logger.info("Cancelled %d task(s) on shutdown", len(tasks))
+        await self.http.close()
+
+    # Notion
+
+    async def fetch_query_page(self, since=None, start_cursor=None, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        params, payload = await asyncio.to_thread(
+            lambda: (app.page_property_filter(tenant), app.query_payload(since, start_cursor, tenant)))
+        with app.metrics.timer("stage", stage="query"):
+            response = await self.http.post(f"{app.NOTION_API_URL}/databases/{tenant.database_id}/query",
+                                            headers=tenant.headers, params=params, json=payload,
+                                            limiter=tenant.limiter)
+        return app.query_page_result(response, tenant)
+
+    async def iter_database_pages(self, since=None, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        if since:
+            logger.info("Fetching pages ending in semicolons edited since %s (%s)", since, tenant.name)
+        else:
+            logger.info("Fetching all pages ending in semicolons from Notion database (%s)", tenant.name)
+
+        total = 0
+        has_more = True
+        start_cursor = None
+        while has_more:
+            data = await self.fetch_query_page(since, start_cursor, tenant)
+            current_pages = data.get("results", [])
+            total += len(current_pages)
+            app.metrics.inc("pages_scanned", len(current_pages), tenant=tenant.name)
+            has_more = data.get("has_more", False)
+            start_cursor = data.get("next_cursor")
+            yield current_pages
+
+        logger.info("Total pages fetched for %s: %d", tenant.name, total)
+
+    async def query_database(self, since=None, tenant=None):
+        try:
+            return [page async for pages in self.iter_database_pages(since, tenant) for page in pages]
+        except self.app.QueryFailed:
+            return None
+
+    async def iter_books_with_semicolon(self, since=None, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        async for pages in self.iter_database_pages(since, tenant):
+            with app.metrics.timer("stage", stage="detect"):
+                books = [book for book in (app.extract_book(page, tenant) for page in pages) if book]
+            app.metrics.inc("books_detected", len(books), tenant=tenant.name)
+            for book in books:
+                yield book
+
+    async def get_page(self, page_id, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        params = await asyncio.to_thread(app.page_property_filter, tenant)
+        response = await self.http.get(f"{app.NOTION_API_URL}/pages/{page_id}", headers=tenant.headers,
+                                       params=params, limiter=tenant.limiter)
+        return app.page_result(page_id, response)
+
+    async def iter_books_from_pages(self, page_ids, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        for page_id in page_ids:
+            page = await self.get_page(page_id, tenant)
+            if page is None:
+                continue
+            if not app.in_tenant_database(page, tenant):
+                app.metrics.inc("books_skipped", reason="other_database")
+                logger.warning("Page %s is not in the %s database, skipping", page_id, tenant.name)
+                continue
+            book = app.extract_book({**page, "id": page_id}, tenant)
+            if book:
+                yield book
+            else:
+                logger.debug("Page %s does not end in a semicolon, skipping", page_id)
+
+    async def update_notion_page(self, page_id, book_data, original_title, current=None, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        data = await asyncio.to_thread(app.page_update_payload, page_id, book_data, original_title, current, tenant)
+        if data is None:
+            return True
+        try:
+            with app.metrics.timer("stage", stage="notion_patch"):
+                response = await self.http.patch(f"{app.NOTION_API_URL}/pages/{page_id}", headers=tenant.headers,
+                                                 json=data, limiter=tenant.limiter)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return app.page_update_failed(page_id, e)
+        return app.page_updated(page_id, response, tenant)
+
+    async def create_notion_page(self, book_data, original_title, tenant=None):
+        app = self.app
+        tenant = app.get_tenant(tenant)
+        if book_data:
+            data = await asyncio.to_thread(app.build_page_data, book_data, original_title, tenant)
+        else:
+            data = await asyncio.to_thread(app.bare_page_data, original_title, tenant)
+        data["parent"] = {"database_id": tenant.database_id}
+        try:
+            with app.metrics.timer("stage", stage="notion_create"):
+                response = await self.http.post(f"{app.NOTION_API_URL}/pages", headers=tenant.headers, json=data,
+                                                limiter=tenant.limiter, idempotent=False)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return app.page_create_failed(original_title, e)
+        return app.page_created(original_title, response, tenant)
+
+    # Book providers
+
+    async def provider_search(self, provider, query, url, params, limiter):
+        app = self.app
+        started = time.perf_counter()
+        try:
+            with app.metrics.timer("search", provider=provider):
+                response = await self.http.get(url, params=params, limiter=limiter)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return app.ranked_provider_results(provider, query, time.perf_counter() - started, None, e)
+        return app.ranked_provider_results(provider, query, time.perf_counter() - started, response)
+
+    async def cached_lookup(self, provider, query):
+        if not self.app.lookup_cache:
+            return False, None
+        return await asyncio.to_thread(self.app.cached_lookup, provider, query)
+
+    async def cache_lookup(self, provider, query, book_data):
+        if not self.app.lookup_cache:
+            return book_data
+        return await asyncio.to_thread(self.app.cache_lookup, provider, query, book_data)
+
+    async def search_google_books(self, query):
+        app = self.app
+        found, cached = await self.cached_lookup("google_books", query)
+        if found:
+            return cached
+        items = await self.provider_search("google_books", query, app.GOOGLE_BOOKS_API_URL,
+                                           app.google_books_params(query), app.google_books_limiter)
+        if items is None:
+            return None
+        return await self.cache_lookup("google_books", query, app.parse_google_volume(items[0], query) if items else None)
+
+    async def search_open_library(self, query):
+        app = self.app
+        found, cached = await self.cached_lookup("open_library", query)
+        if found:
+            return cached
+        docs = await self.provider_search("open_library", query, app.OPEN_LIBRARY_API_URL,
+                                          app.open_library_params(query), app.open_library_limiter)
+        if docs is None:
+            return None
+        return await self.cache_lookup("open_library", query, app.parse_open_library_doc(docs[0], query) if docs else None)
+
+    async def resolve_isbn_batch(self, isbns):
+        app = self.app
+        wanted = {isbn.upper() for isbn in isbns}
+        started = time.perf_counter()
+        try:
+            with app.metrics.timer("search", provider="open_library_batch"):
+                response = await self.http.get(app.OPEN_LIBRARY_API_URL, params=app.isbn_batch_params(wanted),
+                                               limiter=app.open_library_limiter)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return app.isbn_batch_failed(e, time.perf_counter() - started)
+        # Writes every ISBN to the lookup cache
+        return await asyncio.to_thread(app.resolved_isbn_batch, response, wanted, time.perf_counter() - started)
+
+    async def lookup_book(self, book):
+        """Like app.lookup_book(); a hedged lookup cancels the searches it no longer needs."""
+        app = self.app
+        query = book.search_query
+        if app.local_index:
+            book_data = await asyncio.to_thread(app.search_local_index, query)
+            if book_data:
+                return book_data
+
+        attempts = [self.searches[provider] for provider in app.provider_router.order(app.query_kind(query))]
+        if not attempts:
+            logger.warning("Every book provider is unavailable, skipping '%s' for now", query)
+            return None
+        if not app.HEDGED_LOOKUP:
+            for search in attempts:
+                book_data = await search(query)
+                if book_data:
+                    return book_data
+            return None
+
+        loop = asyncio.get_running_loop()
+        async with TaskScope() as scope:
+            tasks = []
+            # Started HEDGE_DELAY apart and taken in preference order, as in app.lookup_hedged()
+            for search in attempts:
+                tasks.append(scope.spawn(search(query)))
+                deadline = loop.time() + app.HEDGE_DELAY
+                while True:
+                    book_data, settled = app.settled_result(tasks)
+                    if book_data:
+                        scope.cancel()
+                        return book_data
+                    remaining = deadline - loop.time()
+                    if settled or remaining <= 0:
+                        break
+                    await asyncio.wait([task for task in tasks if not task.done()], timeout=remaining,
+                                       return_when=asyncio.FIRST_COMPLETED)
+            for task in tasks:
+                book_data = await task
+                if book_data:
+                    scope.cancel()
+                    return book_data
+        return None
+
+    # Processing
+
+    async def process_book(self, book):
+        app = self.app
+        tenant = app.get_tenant(book.tenant)
+        logger.debug("Processing book: %s", book.search_query)
+        try:
+            book_data, book.book_data = book.book_data, None
+            if not book_data:
+                with app.metrics.timer("stage", stage="lookup"):
+                    book_data = await self.lookup_book(book)
+
+            success = False
+            if book_data:
+                success = await self.update_notion_page(book.id, book_data, book.title, book.current, tenant)
+            if app.work_ledger:
+                return await asyncio.to_thread(app.record_book_outcome, book, book_data, success, tenant)
+            return app.record_book_outcome(book, book_data, success, tenant)
+        finally:
+            if app.lease_store:
+                await asyncio.to_thread(app.release_lease, book)
+
+    async def skip_backed_off(self, books):
+        app = self.app
+        async for book in books:
+            if await asyncio.to_thread(app.work_ledger.is_due, app.get_tenant(book.tenant).name, book.id,
+                                       book.search_query):
+                yield book
+            else:
+                app.metrics.inc("books_skipped", reason="backoff")
+                logger.debug("Skipping '%s' until its retry is due", book.search_query)
+
+    def claim_lease(self, book, leased):
+        if self.app.lease_book(book):
+            leased.add(book)
+            return True
+        return False
+
+    async def skip_leased(self, books, leased, claims):
+        """Async version of app.skip_leased(); `claims` holds the claims still running."""
+        async for book in books:
+            # A claim can wait up to 30s for another worker's write lock. It is shielded so
+            # a cancelled run still gets the lease into `leased`, to be released.
+            claim = asyncio.ensure_future(asyncio.to_thread(self.claim_lease, book, leased))
+            claims.add(claim)
+            claim.add_done_callback(claims.discard)
+            if await asyncio.shield(claim):
+                yield book
+
+    async def batch_isbn_lookups(self, books):
+        """Async version of app.batch_isbn_lookups()."""
+        app = self.app
+        pending = []
+
+        async def flush():
+            resolved = await self.resolve_isbn_batch([book.search_query[len("isbn:"):] for book in pending])
+            for book in pending:
+                book_data = resolved.get(book.search_query[len("isbn:"):].upper())
+                if book_data:
+                    book.book_data = book_data
+            flushed = list(pending)
+            pending.clear()
+            return flushed
+
+        async for book in books:
+            if not book.is_isbn:
+                yield book
+                continue
+            if app.local_index:
+                book_data = await asyncio.to_thread(app.search_local_index, book.search_query)
+                if book_data:
+                    book.book_data = book_data
+                    yield book
+                    continue
+            pending.append(book)
+            if len(pending) >= app.ISBN_BATCH_SIZE:
+                for flushed in await flush():
+                    yield flushed
+        if pending:
+            for flushed in await flush():
+                yield flushed
+
+    async def run_books(self, sources):
+        """Process every book from each tenant's async iterator; returns tenant -> Lane like app.run_books().
+
+        At most `max_books` books are in flight across all tenants. Slots
+        are handed out in the order tenants asked for them, so tenants take
+        turns. An iterator that raises (e.g. QueryFailed) ends only its own
+        lane. A book that raises gets a None result and the others carry on;
+        the first such exception is re-raised once every lane is drained,
+        as in FairScheduler.run().
+        """
+        app = self.app
+        # Books claimed but not yet picked up, e.g. waiting for an ISBN batch or a slot
+        leased = set()
+        claims = set()
+        if app.work_ledger:
+            sources = {tenant: self.skip_backed_off(books) for tenant, books in sources.items()}
+        if app.lease_store:
+            sources = {tenant: self.skip_leased(books, leased, claims) for tenant, books in sources.items()}
+        if app.ISBN_BATCH_SIZE > 1:
+            sources = {tenant: self.batch_isbn_lookups(books) for tenant, books in sources.items()}
+        lanes = [Lane(tenant, books) for tenant, books in sources.items()]
+        slots = asyncio.Semaphore(self.max_books)
+        errors = []
+
+        async def handle(lane, index, book):
+            leased.discard(book)
+            try:
+                lane.results[index] = await self.process_book(book)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                slots.release()
+
+        async def feed(lane, scope):
+            try:
+                async for book in lane.iterator:
+                    await slots.acquire()
+                    lane.items.append(book)
+                    lane.results.append(None)
+                    scope.spawn(handle(lane, len(lane.items) - 1, book))
+            except Exception as e:
+                lane.error = e
+            finally:
+                lane.done = True
+
+        try:
+            async with TaskScope() as scope:
+                for lane in lanes:
+                    scope.spawn(feed(lane, scope))
+        finally:
+            # A failed or cancelled run leaves claimed books behind; the heartbeat would keep them forever
+            if claims:
+                await asyncio.wait(set(claims))
+            if leased:
+                await asyncio.to_thread(lambda: [app.release_lease(book) for book in list(leased)])
+        if errors:
+            raise errors[0]
+        return {lane.key: lane for lane in lanes}
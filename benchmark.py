@@ -0,0 +1,1089 @@
+#!/usr/bin/env python
+"""
+Offline benchmarks for the Notion Book Extension.
+
+The pipeline benchmark starts local stand-ins for the Notion, Google Books
+and Open Library APIs, fills a synthetic Notion database, points app.py at
+the stubs and runs process_books() end to end. Nothing touches the network.
+
+    python benchmark.py pipeline --sizes 1000 10000 100000 --latency 0.005
+
+The stubs honor the field projections app.py asks for (Google's `fields`,
+Open Library's `fields` and Notion's `filter_properties`). `--projection
+compare` runs each size with and without them and prints the savings.
+
+The classifier benchmark times series extraction and fiction detection
+per record on a synthetic corpus, against the old per-pattern loops.
+
+    python benchmark.py classifier --records 200000
+
+The ranking benchmark scores app.py's candidate ranking on a small labeled
+set of searches and provider result lists, against taking the top hit.
+
+    python benchmark.py ranking
+
+The memory benchmark measures what a scan keeps per page and per book
+result, comparing full page JSON plus dicts with the slotted records
+that replaced them.
+
+    python benchmark.py memory --pages 100000
+"""
+
+import argparse
+import bisect
+import gc
+import hashlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import resource
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+DATABASE_ID = "bench-database"
+
+# ---------------------------------------------------------------------------
+# Synthetic data
+# ---------------------------------------------------------------------------
+
+def synthetic_isbn(i):
+    """A deterministic 13-digit ISBN-like number for page `i`."""
+    return f"978{i:010d}"
+
+def synthetic_title(i):
+    return f"Synthetic Book {i}"
+
+def make_page(i, title, edited):
+    """Build a Notion page object shaped like the real query results."""
+    return {
+        "object": "page",
+        "id": f"page-{i:08d}",
+        "created_time": edited,
+        "last_edited_time": edited,
+        "parent": {"type": "database_id", "database_id": DATABASE_ID},
+        "cover": None,
+        "icon": None,
+        "properties": {
+            "Title": {
+                "id": "title",
+                "type": "title",
+                "title": [{"type": "text", "text": {"content": title}, "plain_text": title}],
+            },
+            "Description": {"id": "desc", "type": "rich_text", "rich_text": []},
+            "Author(s)": {"id": "auth", "type": "multi_select", "multi_select": []},
+            "Genres": {"id": "genr", "type": "multi_select", "multi_select": []},
+            "Link": {"id": "link", "type": "url", "url": None},
+            "Rating": {"id": "rate", "type": "number", "number": None},
+            "Pages": {"id": "page", "type": "number", "number": None},
+            # Columns people keep alongside the book data, which app.py never reads or writes
+            "Notes": {"id": "note", "type": "rich_text", "rich_text": [
+                {"type": "text", "text": {"content": note}, "plain_text": note}
+                for note in ("Borrowed from the library. ", "Recommended by a friend, read after the sequel. ")
+            ]},
+            "Shelf": {"id": "shlf", "type": "select", "select": {"id": "s1", "name": "To read", "color": "blue"}},
+            "Added": {"id": "addd", "type": "date", "date": {"start": "2024-01-01", "end": None, "time_zone": None}},
+        },
+    }
+
+DATABASE_SCHEMA = {
+    "Title": {"id": "title", "type": "title"},
+    "Description": {"id": "desc", "type": "rich_text"},
+    "Author(s)": {"id": "auth", "type": "multi_select"},
+    "Genres": {"id": "genr", "type": "multi_select"},
+    "Link": {"id": "link", "type": "url"},
+    "Rating": {"id": "rate", "type": "number"},
+    "Pages": {"id": "page", "type": "number"},
+    "Cover": {"id": "covr", "type": "url"},
+    "Series": {"id": "seri", "type": "multi_select"},
+    "DatePublished": {"id": "date", "type": "date"},
+    "Non/Fiction": {"id": "nonf", "type": "select"},
+    "ISBN": {"id": "isbn", "type": "rich_text"},
+    "Search Term": {"id": "term", "type": "rich_text"},
+    "Notes": {"id": "note", "type": "rich_text"},
+    "Shelf": {"id": "shlf", "type": "select"},
+    "Added": {"id": "addd", "type": "date"},
+}
+
+def build_database(size, semicolon_ratio, isbn_ratio, seed=42):
+    """Create `size` pages, a fraction of which have titles ending in ';'."""
+    rng = random.Random(seed)
+    edited = "2024-01-01T00:00:00.000Z"
+    pages = []
+    for i in range(size):
+        if rng.random() < semicolon_ratio:
+            base = synthetic_isbn(i) if rng.random() < isbn_ratio else synthetic_title(i)
+            title = f"{base};"
+        else:
+            title = synthetic_title(i)
+        pages.append(make_page(i, title, edited))
+    return pages
+
+def page_title(page):
+    return "".join(t.get("plain_text", "") for t in page["properties"]["Title"]["title"])
+
+def stable_fraction(text):
+    """Map a string to a stable number in [0, 1) for deterministic stub behavior."""
+    return int(hashlib.md5(text.encode()).hexdigest()[:8], 16) / 0x100000000
+
+def parse_partial_fields(spec):
+    """Parse Google's partial response syntax, e.g. "items(volumeInfo(title,authors))".
+
+    Returns a nested dict of selected keys, where None selects the whole
+    value. The "a/b" path shorthand isn't supported.
+    """
+    def parse(pos):
+        tree = {}
+        name = ""
+        while pos < len(spec):
+            char = spec[pos]
+            pos += 1
+            if char == "(":
+                tree[name], pos = parse(pos)
+                name = ""
+            elif char == ")":
+                break
+            elif char == ",":
+                if name:
+                    tree[name] = None
+                name = ""
+            else:
+                name += char
+        if name:
+            tree[name] = None
+        return tree, pos
+    return parse(0)[0]
+
+def project(value, tree):
+    """Keep only the parts of `value` selected by a parse_partial_fields() tree."""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+def query_params(path):
+    return parse_qs(urlsplit(path).query)
+
+# ---------------------------------------------------------------------------
+# Stub servers
+# ---------------------------------------------------------------------------
+
+class StubState:
+    """Counters shared by a stub server's handler threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.repeat_patches = 0
+
+    def count(self, name, nbytes_sent, nbytes_received):
+        with self.lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            self.bytes_sent += nbytes_sent
+            self.bytes_received += nbytes_received
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "requests": dict(self.requests),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "repeat_patches": self.repeat_patches,
+            }
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Base handler: latency, error injection and JSON responses."""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # Headers and body are written separately
+    config = {}
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.request_bytes = length
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, status, body, name):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if status == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(payload)
+        if name:
+            self.state.count(name, len(payload), getattr(self, "request_bytes", 0))
+            self.request_bytes = 0
+
+    def handle_stats(self):
+        if urlsplit(self.path).path == "/_stats":
+            self.send_json(200, self.state.snapshot(), None)
+            return True
+        return False
+
+    def simulate(self, name):
+        """Apply configured latency; return True if an error was sent instead."""
+        latency = self.config.get("latency", 0)
+        if latency:
+            time.sleep(latency)
+        if random.random() < self.config.get("error_rate", 0):
+            status = random.choice([429, 502, 503])
+            self.send_json(status, {"object": "error", "status": status}, f"{name}_error")
+            return True
+        return False
+
+class NotionStub(StubHandler):
+    """Implements the slice of the Notion API that app.py uses."""
+
+    pages = []
+    page_index = {}
+    semicolon_ids = set()
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        body = self.read_json()
+        if path == "/v1/pages":
+            self.create_page(body)
+            return
+        if not path.endswith("/query"):
+            self.send_json(404, {"object": "error"}, "notion_other")
+            return
+        if self.simulate("notion_query"):
+            return
+        results, next_cursor = self.run_query(body)
+        self.send_json(200, {
+            "object": "list",
+            "results": [self.filter_properties(page) for page in results],
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
+        }, "notion_query")
+
+    def do_GET(self):
+        if self.handle_stats():
+            return
+        path = urlsplit(self.path).path
+        if self.simulate("notion_get"):
+            return
+        if path.startswith("/v1/databases/"):
+            properties = {name: {**prop, "name": name} for name, prop in DATABASE_SCHEMA.items()}
+            self.send_json(200, {"object": "database", "id": DATABASE_ID, "properties": properties}, "notion_get")
+        elif path.startswith("/v1/pages/"):
+            page = self.page_index.get(path.rsplit("/", 1)[-1])
+            if page is None:
+                self.send_json(404, {"object": "error"}, "notion_get")
+            else:
+                self.send_json(200, self.filter_properties(page), "notion_get")
+        else:
+            self.send_json(404, {"object": "error"}, "notion_get")
+
+    def do_PATCH(self):
+        path = urlsplit(self.path).path
+        body = self.read_json()
+        if self.simulate("notion_patch"):
+            return
+        page = self.page_index.get(path.rsplit("/", 1)[-1])
+        if page is None:
+            self.send_json(404, {"object": "error"}, "notion_patch")
+            return
+        with self.state.lock:
+            if page["id"] not in self.semicolon_ids:
+                # Already filled in by an earlier PATCH: duplicated work
+                self.state.repeat_patches += 1
+            for name, value in body.get("properties", {}).items():
+                if "title" in value or name.lower() == "title":
+                    text = "".join(t["text"]["content"] for t in value.get("title", []))
+                    page["properties"]["Title"]["title"] = [
+                        {"type": "text", "text": {"content": text}, "plain_text": text}
+                    ]
+                else:
+                    page["properties"][name] = value
+            for key in ("cover", "icon"):
+                if key in body:
+                    page[key] = body[key]
+            page["last_edited_time"] = time.strftime("%Y-%m-%dT%H:%M:00.000Z", time.gmtime())
+            if not page_title(page).endswith(";"):
+                self.semicolon_ids.discard(page["id"])
+        self.send_json(200, page, "notion_patch")
+
+    def filter_properties(self, page):
+        """Apply the request's `filter_properties` (property IDs), if any."""
+        ids = query_params(self.path).get("filter_properties")
+        if not ids:
+            return page
+        properties = {name: value for name, value in page["properties"].items() if value.get("id") in ids}
+        return {**page, "properties": properties}
+
+    def create_page(self, body):
+        if self.simulate("notion_create"):
+            return
+        with self.state.lock:
+            page_id = f"created-{len(self.page_index):08d}"
+            page = {"object": "page", "id": page_id, "parent": body.get("parent"),
+                    "properties": body.get("properties", {})}
+            for key in ("cover", "icon"):
+                if key in body:
+                    page[key] = body[key]
+            # Not added to the queryable pages: created titles never end in ';'
+            self.page_index[page_id] = page
+        self.send_json(200, page, "notion_create")
+
+    def run_query(self, body):
+        """Apply the (subset of) Notion filters app.py sends, then paginate."""
+        filters = body.get("filter") or {}
+        conditions = filters.get("and", [filters] if filters else [])
+        ends_with = None
+        since = None
+        for condition in conditions:
+            if "title" in condition:
+                ends_with = condition["title"].get("ends_with")
+            if condition.get("timestamp") == "last_edited_time":
+                since = condition["last_edited_time"].get("on_or_after")
+
+        with self.state.lock:
+            if ends_with == ";":
+                candidates = [self.page_index[pid] for pid in sorted(self.semicolon_ids)]
+            else:
+                candidates = list(self.pages)
+        if ends_with is not None:
+            candidates = [p for p in candidates if page_title(p).endswith(ends_with)]
+        if since:
+            candidates = [p for p in candidates if p["last_edited_time"] >= since]
+
+        # Like Notion, the cursor names the next page rather than an offset, so
+        # pages dropping out of the filter mid-scan don't shift the results
+        candidates.sort(key=lambda p: p["id"])
+        page_size = min(int(body.get("page_size", 100)), self.config.get("page_size", 100))
+        cursor = body.get("start_cursor")
+        start = bisect.bisect_left([p["id"] for p in candidates], cursor) if cursor else 0
+        end = start + page_size
+        next_cursor = candidates[end]["id"] if end < len(candidates) else None
+        return candidates[start:end], next_cursor
+
+class GoogleBooksStub(StubHandler):
+    """Returns one deterministic volume per query, or no items for misses."""
+
+    def do_GET(self):
+        if self.handle_stats():
+            return
+        if self.simulate("google_books"):
+            return
+        params = query_params(self.path)
+        query = params.get("q", [""])[0]
+        fields = parse_partial_fields(params["fields"][0]) if "fields" in params else None
+        if stable_fraction("google:" + query) < self.config.get("miss_rate", 0):
+            self.send_json(200, project({"kind": "books#volumes", "totalItems": 0}, fields), "google_books")
+            return
+        isbn = query[5:] if query.startswith("isbn:") else synthetic_isbn(int(stable_fraction(query) * 1e9))
+        self.send_json(200, project({
+            "kind": "books#volumes",
+            "totalItems": 1,
+            "items": [{
+                "kind": "books#volume",
+                "id": hashlib.md5(query.encode()).hexdigest()[:12],
+                "etag": "stub",
+                "selfLink": "http://stub/volume",
+                "volumeInfo": {
+                    "title": query.replace("isbn:", "ISBN Book "),
+                    "subtitle": "A Synthetic Series",
+                    "authors": ["Ada Author", "Bob Writer"],
+                    "publisher": "Stub Press",
+                    "publishedDate": "2001-05-17",
+                    "description": "A synthetic description. " * 20,
+                    "industryIdentifiers": [{"type": "ISBN_13", "identifier": isbn},
+                                            {"type": "ISBN_10", "identifier": isbn[3:]}],
+                    "readingModes": {"text": False, "image": False},
+                    "pageCount": 321,
+                    "printType": "BOOK",
+                    "categories": ["Fiction / Fantasy"],
+                    "averageRating": 4.0,
+                    "ratingsCount": 12,
+                    "maturityRating": "NOT_MATURE",
+                    "allowAnonLogging": False,
+                    "contentVersion": "0.1.0.0.preview.0",
+                    "panelizationSummary": {"containsEpubBubbles": False, "containsImageBubbles": False},
+                    "language": "en",
+                    "imageLinks": {"smallThumbnail": "http://stub/cover-small.jpg",
+                                   "thumbnail": "http://stub/cover.jpg"},
+                    "previewLink": "http://stub/preview",
+                    "infoLink": "http://stub/info",
+                    "canonicalVolumeLink": "http://stub/canonical",
+                },
+                "saleInfo": {"country": "US", "saleability": "NOT_FOR_SALE", "isEbook": False},
+                "accessInfo": {
+                    "country": "US",
+                    "viewability": "NO_PAGES",
+                    "embeddable": False,
+                    "publicDomain": False,
+                    "textToSpeechPermission": "ALLOWED",
+                    "epub": {"isAvailable": False},
+                    "pdf": {"isAvailable": False},
+                    "webReaderLink": "http://stub/reader",
+                    "accessViewStatus": "NONE",
+                    "quoteSharingAllowed": False,
+                },
+                "searchInfo": {"textSnippet": "A synthetic snippet for the search results page."},
+            }],
+        }, fields), "google_books")
+
+class OpenLibraryStub(StubHandler):
+    """Returns one deterministic search doc per query, or none for misses."""
+
+    def do_GET(self):
+        if self.handle_stats():
+            return
+        if self.simulate("open_library"):
+            return
+        params = query_params(self.path)
+        query = params.get("q", [""])[0]
+        fields = params["fields"][0].split(",") if "fields" in params else None
+        if query.startswith("isbn:("):
+            # Batched ISBN search: isbn:(A OR B OR ...)
+            isbns = query[len("isbn:("):-1].split(" OR ")
+            docs = [self.make_doc(f"isbn:{isbn}", isbn, fields) for isbn in isbns
+                    if stable_fraction(f"openlibrary:isbn:{isbn}") >= self.config.get("miss_rate", 0)]
+            self.send_json(200, {"numFound": len(docs), "docs": docs}, "open_library")
+            return
+        if stable_fraction("openlibrary:" + query) < self.config.get("miss_rate", 0):
+            self.send_json(200, {"numFound": 0, "docs": []}, "open_library")
+            return
+        isbn = query[5:] if query.startswith("isbn:") else synthetic_isbn(int(stable_fraction(query) * 1e9))
+        self.send_json(200, {"numFound": 1, "docs": [self.make_doc(query, isbn, fields)]}, "open_library")
+
+    @staticmethod
+    def make_doc(query, isbn, fields=None):
+        doc = {
+            "key": "/works/OL1W",
+            "title": query.replace("isbn:", "ISBN Book "),
+            "author_name": ["Ada Author"],
+            "first_publish_year": 2001,
+            "isbn": [isbn, isbn[3:]],
+            "subject": ["Fantasy fiction", "Dragons"] * 10,
+            "number_of_pages_median": 300,
+            "cover_i": 12345,
+            "edition_count": 7,
+            "publisher": ["Stub Press"] * 5,
+            "language": ["eng"],
+            "author_key": ["OL1A"],
+            "edition_key": [f"OL{n}M" for n in range(1, 8)],
+            "publish_date": ["May 17, 2001", "2003", "2010"],
+            "publish_year": [2001, 2003, 2010],
+            "id_goodreads": ["1234567", "7654321"],
+            "ebook_access": "no_ebook",
+            "has_fulltext": False,
+        }
+        if fields:
+            doc = {key: value for key, value in doc.items() if key in fields}
+        return doc
+
+def serve_stubs(database_size, config, ports_queue):
+    """Run the three stub servers until the process is terminated."""
+    NotionStub.pages = build_database(database_size, config["semicolon_ratio"], config["isbn_ratio"])
+    NotionStub.page_index = {page["id"]: page for page in NotionStub.pages}
+    NotionStub.semicolon_ids = {page["id"] for page in NotionStub.pages if page_title(page).endswith(";")}
+
+    ports = {}
+    for name, handler in (("notion", NotionStub), ("google_books", GoogleBooksStub),
+                          ("open_library", OpenLibraryStub)):
+        handler.config = {**config, **config.get("overrides", {}).get(name, {})}
+        handler.state = StubState()
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        ports[name] = server.server_port
+    ports_queue.put(ports)
+    threading.Event().wait()
+
+def fetch_stats(port):
+    import requests
+    return requests.get(f"http://127.0.0.1:{port}/_stats", timeout=10).json()
+
+# ---------------------------------------------------------------------------
+# Pipeline benchmark
+# ---------------------------------------------------------------------------
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def run_pipeline(ports, options, result_queue):
+    """Import app.py against the stubs, run process_books() and time each stage."""
+    os.environ.update({
+        "LOOKUP_CACHE_ENABLED": "false",
+        "LEDGER_ENABLED": "false",
+        "INCREMENTAL_SYNC": "false",
+        "DATABASE_ID": DATABASE_ID,
+        "PROCESS_CONCURRENCY": str(options["concurrency"]),
+        "NOTION_RATE_LIMIT": str(options["rate_limit"]),
+        "GOOGLE_BOOKS_RATE_LIMIT": str(options["rate_limit"]),
+        "OPEN_LIBRARY_RATE_LIMIT": str(options["rate_limit"]),
+        "HTTP_BACKOFF_BASE": "0.01",
+        "HEDGED_LOOKUP": "true" if options["hedged"] else "false",
+        "ISBN_BATCH_SIZE": str(options["isbn_batch_size"]),
+        "FIELD_PROJECTION": "true" if options["projection"] else "false",
+        "PROVIDER_ROUTING": "false" if options["no_routing"] else "true",
+        "ENGINE": options["engine"],
+        "WORKER_COUNT": str(options["workers"]),
+        "WORKER_INDEX": str(options.get("worker_index", 0)),
+        "LEASE_PATH": options.get("lease_path", "leases.sqlite3"),
+        "LOG_LEVEL": "WARNING",
+    })
+    import requests
+    import app
+
+    app.NOTION_API_URL = f"http://127.0.0.1:{ports['notion']}/v1"
+    app.GOOGLE_BOOKS_API_URL = f"http://127.0.0.1:{ports['google_books']}/books/v1/volumes"
+    app.OPEN_LIBRARY_API_URL = f"http://127.0.0.1:{ports['open_library']}/search.json"
+
+    stages = {name: {"latencies": [], "peak_rss_mb": 0.0} for name in ("query", "search", "update", "parse", "book")}
+    lock = threading.Lock()
+
+    def timed(stage, func):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                rss = peak_rss_mb()
+                with lock:
+                    stages[stage]["latencies"].append(elapsed)
+                    stages[stage]["peak_rss_mb"] = max(stages[stage]["peak_rss_mb"], rss)
+        return wrapper
+
+    def timed_async(stage, func):
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                rss = peak_rss_mb()
+                with lock:
+                    stages[stage]["latencies"].append(elapsed)
+                    stages[stage]["peak_rss_mb"] = max(stages[stage]["peak_rss_mb"], rss)
+        return wrapper
+
+    first_book = []
+
+    def note_first_book():
+        if not first_book:
+            first_book.append(time.perf_counter() - started)
+
+    if app.engine:
+        # The engine's coroutines call each other through the instance, so wrap them there
+        import async_engine
+        engine = app.engine
+        engine.fetch_query_page = timed_async("query", engine.fetch_query_page)
+        engine.lookup_book = timed_async("search", engine.lookup_book)
+        engine.update_notion_page = timed_async("update", engine.update_notion_page)
+        async_engine.FetchedResponse.json = timed("parse", async_engine.FetchedResponse.json)
+        process_book_async = timed_async("book", engine.process_book)
+
+        async def process_book_first_async(book):
+            result = await process_book_async(book)
+            note_first_book()
+            return result
+
+        engine.process_book = process_book_first_async
+    else:
+        app.fetch_query_page = timed("query", app.fetch_query_page)
+        app.lookup_book = timed("search", app.lookup_book)
+        app.update_notion_page = timed("update", app.update_notion_page)
+        requests.Response.json = timed("parse", requests.Response.json)
+        process_book = timed("book", app.process_book)
+
+        def process_book_first(book):
+            result = process_book(book)
+            note_first_book()
+            return result
+
+        app.process_book = process_book_first
+
+    started = time.perf_counter()
+    books = app.process_books()
+    wall = time.perf_counter() - started
+
+    result_queue.put({
+        "wall": wall,
+        "first_book": first_book[0] if first_book else None,
+        "books": len(books),
+        "stages": stages,
+        "peak_rss_mb": peak_rss_mb(),
+    })
+
+def merge_results(results):
+    """Combine the runs of workers that shared one stub database, and summarize each stage."""
+    first_books = [result["first_book"] for result in results if result["first_book"] is not None]
+    stages = {}
+    for name in results[0]["stages"]:
+        latencies = [latency for result in results for latency in result["stages"][name]["latencies"]]
+        stages[name] = {
+            "calls": len(latencies),
+            "total": sum(latencies),
+            "p50": percentile(latencies, 50),
+            "p99": percentile(latencies, 99),
+            "peak_rss_mb": max(result["stages"][name]["peak_rss_mb"] for result in results),
+        }
+    return {
+        "workers": len(results),
+        "wall": max(result["wall"] for result in results),
+        "first_book": min(first_books) if first_books else None,
+        "books": sum(result["books"] for result in results),
+        "stages": stages,
+        # Per process; the workers' total is roughly this times the worker count
+        "peak_rss_mb": max(result["peak_rss_mb"] for result in results),
+    }
+
+def benchmark_size(size, options):
+    """Benchmark one synthetic database size; stubs and app run in fresh processes."""
+    ctx = multiprocessing.get_context("spawn")
+    ports_queue = ctx.Queue()
+    stub_config = {
+        "latency": options["latency"],
+        "error_rate": options["error_rate"],
+        "page_size": options["page_size"],
+        "miss_rate": options["miss_rate"],
+        "semicolon_ratio": options["semicolon_ratio"],
+        "isbn_ratio": options["isbn_ratio"],
+        "overrides": {"google_books": {
+            key: value for key, value in (("latency", options["google_latency"]),
+                                          ("error_rate", options["google_error_rate"]))
+            if value is not None
+        }},
+    }
+    stubs = ctx.Process(target=serve_stubs, args=(size, stub_config, ports_queue), daemon=True)
+    stubs.start()
+    try:
+        ports = ports_queue.get(timeout=300)
+        result_queue = ctx.Queue()
+        with tempfile.TemporaryDirectory() as lease_dir:
+            # Several workers split the pages by shard and share one lease file, as with workers.py
+            workers = [
+                ctx.Process(target=run_pipeline, args=(ports, {
+                    **options, "worker_index": index, "lease_path": os.path.join(lease_dir, "leases.sqlite3"),
+                }, result_queue))
+                for index in range(options["workers"])
+            ]
+            for worker in workers:
+                worker.start()
+            results = [result_queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+        result = merge_results(results)
+        result["stub_stats"] = {name: fetch_stats(port) for name, port in ports.items()}
+    finally:
+        stubs.terminate()
+        stubs.join()
+    return result
+
+def print_report(size, result):
+    books = result["books"]
+    stub_stats = result["stub_stats"]
+    total_requests = sum(sum(s["requests"].values()) for s in stub_stats.values())
+    total_bytes = sum(s["bytes_sent"] for s in stub_stats.values())
+    request_bytes = sum(s["bytes_received"] for s in stub_stats.values())
+    book_stage = result["stages"]["book"]
+
+    print(f"\n=== {size:,} pages, {books:,} semicolon books ===")
+    if result["workers"] > 1:
+        print(f"workers           {result['workers']}")
+        print(f"repeat PATCHes    {stub_stats['notion']['repeat_patches']}")
+    print(f"wall time         {result['wall']:.2f}s")
+    print(f"pages/sec         {size / result['wall']:,.0f}")
+    print(f"books/sec         {books / result['wall']:,.1f}" if result["wall"] else "books/sec         n/a")
+    print(f"requests/book     {total_requests / books:.2f}" if books else f"requests          {total_requests}")
+    print(f"response bytes    {total_bytes:,}")
+    print(f"request bytes     {request_bytes:,}")
+    if result["first_book"] is not None:
+        print(f"first book done   {result['first_book'] * 1000:.1f}ms")
+    print(f"per-book latency  p50 {book_stage['p50'] * 1000:.1f}ms  p99 {book_stage['p99'] * 1000:.1f}ms")
+    print(f"peak RSS          {result['peak_rss_mb']:.1f} MB")
+    print(f"{'stage':<8}{'calls':>8}{'total s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak RSS MB':>13}")
+    for name in ("query", "search", "update", "parse"):
+        stage = result["stages"][name]
+        print(f"{name:<8}{stage['calls']:>8}{stage['total']:>10.2f}{stage['p50'] * 1000:>10.1f}"
+              f"{stage['p99'] * 1000:>10.1f}{stage['peak_rss_mb']:>13.1f}")
+    for name, stats in stub_stats.items():
+        counts = ", ".join(f"{k}={v}" for k, v in sorted(stats["requests"].items()))
+        print(f"  {name}: {counts or 'no requests'}")
+
+def print_projection_savings(size, projected, full):
+    """Compare a run with field projection against one without it."""
+    print(f"\n=== {size:,} pages: field projection savings ===")
+    print(f"{'':<22}{'projected':>14}{'full':>14}{'saved':>8}")
+
+    def row(label, new, old, fmt):
+        saved = f"{(1 - new / old) * 100:.0f}%" if old else "n/a"
+        print(f"{label:<22}{fmt(new):>14}{fmt(old):>14}{saved:>8}")
+
+    for name in full["stub_stats"]:
+        row(f"{name} bytes", projected["stub_stats"][name]["bytes_sent"], full["stub_stats"][name]["bytes_sent"],
+            lambda v: f"{v:,}")
+    row("JSON parse s", projected["stages"]["parse"]["total"], full["stages"]["parse"]["total"],
+        lambda v: f"{v:.3f}")
+    row("query stage s", projected["stages"]["query"]["total"], full["stages"]["query"]["total"],
+        lambda v: f"{v:.2f}")
+    row("wall s", projected["wall"], full["wall"], lambda v: f"{v:.2f}")
+    row("peak RSS MB", projected["peak_rss_mb"], full["peak_rss_mb"], lambda v: f"{v:.1f}")
+
+def pipeline_command(args):
+    options = {
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "page_size": args.page_size,
+        "miss_rate": args.miss_rate,
+        "semicolon_ratio": args.semicolon_ratio,
+        "isbn_ratio": args.isbn_ratio,
+        "concurrency": args.concurrency,
+        "rate_limit": args.rate_limit,
+        "hedged": args.hedge,
+        "isbn_batch_size": args.isbn_batch_size,
+        "projection": args.projection != "off",
+        "google_latency": args.google_latency,
+        "google_error_rate": args.google_error_rate,
+        "no_routing": args.no_routing,
+        "engine": args.engine,
+        "workers": args.workers,
+    }
+    for size in args.sizes:
+        result = benchmark_size(size, options)
+        print_report(size, result)
+        if args.projection == "compare":
+            full = benchmark_size(size, {**options, "projection": False})
+            print_report(size, full)
+            print_projection_savings(size, result, full)
+
+# ---------------------------------------------------------------------------
+# Classifier benchmark
+# ---------------------------------------------------------------------------
+
+TITLE_WORDS = ["Shadow", "Empire", "Night", "River", "Crown", "Glass", "Winter", "Iron", "Garden", "Storm"]
+TITLE_SUFFIXES = ["", "", "", " Series", " Trilogy", " Saga", " Chronicles", " (The Broken Earth Book 2)",
+                  ": Book 3 of the Expanse", " [Discworld #7]", " Volume 2 of the Archive"]
+SUBTITLES = ["", "", "A Novel", "The Lost Chronicles", "Book 1 of the Stormlight Archive", "A Memoir"]
+CATEGORIES = ["Fiction / Fantasy / Epic", "History / Europe", "Juvenile Fiction", "Science Fiction",
+              "Biography & Autobiography", "Cooking", "Travel", "Poetry", "Mystery", "Art / General",
+              "Self-Help", "Comics & Graphic Novels", "Philosophy", "Romance / Historical"]
+
+def build_classifier_corpus(size, seed=42):
+    """Synthetic (title, subtitle, categories, query) records shaped like provider results."""
+    rng = random.Random(seed)
+    records = []
+    for _ in range(size):
+        title = " ".join(rng.choice(TITLE_WORDS) for _ in range(rng.randint(1, 5))) + rng.choice(TITLE_SUFFIXES)
+        categories = rng.sample(CATEGORIES, rng.randint(0, 3))
+        records.append((title, rng.choice(SUBTITLES), categories, title.lower()))
+    return records
+
+def legacy_classify(title, subtitle, categories, query):
+    """The per-call, per-pattern implementation the classifier module replaced."""
+    fiction_status = None
+    non_fiction_keywords = ["non-fiction", "nonfiction", "biography", "history",
+                           "science", "self-help", "business", "psychology",
+                           "philosophy", "politics"]
+    fiction_keywords = ["fiction", "novel", "fantasy", "sci-fi", "science fiction",
+                       "thriller", "mystery", "romance"]
+    for category in categories:
+        category_lower = category.lower()
+        if any(keyword in category_lower for keyword in non_fiction_keywords):
+            fiction_status = "Nonfiction"
+            break
+        if any(keyword in category_lower for keyword in fiction_keywords):
+            fiction_status = "Fiction"
+            break
+    if fiction_status is None:
+        if "fiction" in query.lower():
+            fiction_status = "Fiction"
+        elif "non-fiction" in query.lower() or "nonfiction" in query.lower():
+            fiction_status = "Nonfiction"
+        else:
+            fiction_status = "Fiction"
+
+    series_name = None
+    series_patterns = [
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Series(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Trilogy(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Saga(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Chronicles(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Sequence(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Duology(?:\s|$)",
+        r"(?:^|\s)(?:The\s)?(.*?)\s+Quartet(?:\s|$)",
+        r"Book\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
+        r"Volume\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
+        r"\((?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\)",
+        r"\[(?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\]",
+    ]
+    for pattern in series_patterns:
+        match = re.search(pattern, title, re.IGNORECASE)
+        if match:
+            series_name = match.group(1).strip()
+            break
+        if subtitle:
+            match = re.search(pattern, subtitle, re.IGNORECASE)
+            if match:
+                series_name = match.group(1).strip()
+                break
+    return fiction_status, series_name
+
+def classifier_command(args):
+    import classifier
+
+    def combined(title, subtitle, categories, query):
+        return classifier.classify_fiction(categories, query), classifier.extract_series(title, subtitle)
+
+    records = build_classifier_corpus(args.records)
+    mismatches = sum(legacy_classify(*record) != combined(*record) for record in records)
+    print(f"{len(records):,} records, {mismatches} mismatches between implementations")
+
+    print(f"{'implementation':<16}{'total s':>10}{'us/record':>12}")
+    for name, func in (("per-pattern", legacy_classify), ("combined", combined)):
+        best = float("inf")
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            for record in records:
+                func(*record)
+            best = min(best, time.perf_counter() - started)
+        print(f"{name:<16}{best:>10.3f}{best / len(records) * 1e6:>12.2f}")
+
+# ---------------------------------------------------------------------------
+# Ranking benchmark
+# ---------------------------------------------------------------------------
+
+def volume(title, authors, isbns=(), subtitle=""):
+    return title, subtitle, list(authors), list(isbns)
+
+# (search term, provider results in provider order, index of the right book or None)
+LABELED_SEARCHES = [
+    ("the hobbit", [volume("SparkNotes: The Hobbit", ["SparkNotes"]),
+                    volume("The Hobbit", ["J.R.R. Tolkien"], subtitle="or There and Back Again")], 1),
+    ("dune", [volume("Dune Messiah", ["Frank Herbert"]), volume("Dune", ["Frank Herbert"])], 1),
+    ("dune frank herbert", [volume("Dune", ["Frank Herbert"]),
+                            volume("The Road to Dune", ["Frank Herbert", "Brian Herbert", "Kevin J. Anderson"])], 0),
+    ("project hail mary", [volume("Project Hail Mary", ["Andy Weir"], subtitle="A Novel")], 0),
+    ("hobit tolkien", [volume("The Hobbit", ["J. R. R. Tolkien"]),
+                       volume("Tolkien: A Biography", ["Humphrey Carpenter"])], 0),
+    ("sapiens", [volume("Summary of Sapiens", ["Readtrepreneur Publishing"], subtitle="A Brief History of Humankind"),
+                 volume("Sapiens", ["Yuval Noah Harari"], subtitle="A Brief History of Humankind")], 1),
+    ("the name of the wind", [volume("The Wise Man's Fear", ["Patrick Rothfuss"]),
+                              volume("The Name of the Wind", ["Patrick Rothfuss"])], 1),
+    ("asdkjh qwe", [volume("Cooking for Beginners", ["Anonymous"])], None),
+    ("isbn:9780553418026", [volume("The Martian", ["Andy Weir"], ["9780804139021", "0804139024"]),
+                            volume("The Martian", ["Andy Weir"], ["9780553418026", "0553418025"])], 1),
+    ("isbn:0553418025", [volume("The Martian", ["Andy Weir"], ["9780804139021"]),
+                         volume("The Martian", ["Andy Weir"], ["9780553418026"])], 1),
+    ("the road cormac mccarthy", [volume("On the Road", ["Jack Kerouac"]),
+                                  volume("The Road", ["Cormac McCarthy"])], 1),
+    ("it stephen king", [volume("It Ends with Us", ["Colleen Hoover"]),
+                         volume("It", ["Stephen King"], subtitle="A Novel")], 1),
+    ("1984", [volume("1984", ["George Orwell"]), volume("Nineteen Eighty-Four", ["George Orwell"])], 0),
+    ("harry potter and the philosopher's stone",
+     [volume("Harry Potter and the Chamber of Secrets", ["J.K. Rowling"]),
+      volume("Harry Potter and the Philosopher's Stone", ["J.K. Rowling"])], 1),
+    ("les miserables", [volume("Les Misérables", ["Victor Hugo"])], 0),
+    ("the three body problem", [volume("The Three-Body Problem", ["Cixin Liu"]),
+                                volume("Death's End", ["Cixin Liu"])], 0),
+    ("educated tara westover", [volume("Educated", ["Tara Westover"], subtitle="A Memoir")], 0),
+    ("gone girl", [volume("Gone Girl", ["Gillian Flynn"]), volume("Gone with the Wind", ["Margaret Mitchell"])], 0),
+    ("gone with the wind", [volume("Gone Girl", ["Gillian Flynn"]),
+                            volume("Gone with the Wind", ["Margaret Mitchell"])], 1),
+    ("atomic habits", [volume("Workbook for Atomic Habits", ["Brainy Press"]),
+                       volume("Atomic Habits", ["James Clear"],
+                              subtitle="An Easy & Proven Way to Build Good Habits & Break Bad Ones")], 1),
+    ("the fellowship of the ring",
+     [volume("The Lord of the Rings", ["J.R.R. Tolkien"]),
+      volume("The Fellowship of the Ring", ["J.R.R. Tolkien"], subtitle="Being the First Part of The Lord of the Rings")],
+     1),
+    ("zzzz qqqq xyzzy", [volume("The Unknown Soldier", ["Vaino Linna"])], None),
+    ("circe madeline miller", [volume("Circe", ["Madeline Miller"]),
+                               volume("The Song of Achilles", ["Madeline Miller"])], 0),
+    ("the song of achilles", [volume("Circe", ["Madeline Miller"]),
+                              volume("The Song of Achilles", ["Madeline Miller"])], 1),
+    ("thinking fast and slow", [volume("Thinking, Fast and Slow", ["Daniel Kahneman"])], 0),
+    ("becoming michelle obama", [volume("Becoming", ["Michelle Obama"]),
+                                 volume("Becoming Michelle Obama", ["Unofficial Biographies"])], 0),
+    ("a court of thorns and roses", [volume("A Court of Mist and Fury", ["Sarah J. Maas"]),
+                                     volume("A Court of Thorns and Roses", ["Sarah J. Maas"])], 1),
+    ("where the crawdads sing", [volume("Where the Crawdads Sing", ["Delia Owens"])], 0),
+    ("the silent patient", [volume("Study Guide: The Silent Patient by Alex Michaelides", ["SuperSummary"]),
+                            volume("The Silent Patient", ["Alex Michaelides"])], 1),
+    ("no results for this", [], None),
+    ("война и мир", [volume("Анна Каренина", ["Лев Толстой"]), volume("Война и мир", ["Лев Толстой"])], 1),
+    ("ノルウェイの森", [volume("ノルウェイの森 上", ["村上春樹"]), volume("海辺のカフカ", ["村上春樹"])], 0),
+    ("Οδύσσεια", [volume("Οδύσσεια", ["Όμηρος"])], 0),
+    ("мастер и маргарита булгаков", [volume("Собачье сердце", ["Михаил Булгаков"])], None),
+]
+
+def ranking_command(args):
+    from ranking import rank_results
+
+    min_score = args.min_score
+    correct = {"top hit": 0, "ranked": 0}
+    for query, candidates, expected in LABELED_SEARCHES:
+        top_hit = 0 if candidates else None
+        ranked = rank_results(query, candidates, lambda candidate: candidate, min_score)
+        best = candidates.index(ranked[0]) if ranked else None
+        correct["top hit"] += top_hit == expected
+        correct["ranked"] += best == expected
+        if best != expected:
+            print(f"wrong: {query!r} -> {best}, expected {expected}")
+
+    total = len(LABELED_SEARCHES)
+    print(f"{total} labeled searches, MATCH_MIN_SCORE {min_score}")
+    for name, count in correct.items():
+        print(f"{name:<10}{count:>4}/{total}  {count / total:.0%}")
+
+    candidates = sum(len(candidates) for _, candidates, _ in LABELED_SEARCHES)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for query, results, _ in LABELED_SEARCHES:
+            rank_results(query, results, lambda candidate: candidate, min_score)
+    elapsed = time.perf_counter() - started
+    print(f"ranking cost  {elapsed / (args.repeat * total) * 1e6:.1f} us/search, "
+          f"{elapsed / (args.repeat * candidates) * 1e6:.1f} us/candidate")
+
+# ---------------------------------------------------------------------------
+# Memory benchmark
+# ---------------------------------------------------------------------------
+
+def legacy_job(app, page):
+    """A book job the way extract_book() built it before BookJob: a dict."""
+    job = app.extract_book(page)
+    return {
+        "id": job.id,
+        "title": job.title,
+        "search_query": job.search_query,
+        "is_isbn": job.is_isbn,
+        "current": job.current,
+        "tenant": job.tenant,
+    }
+
+def traced_bytes(build):
+    """Run build() and return (its result, bytes allocated and still held afterwards)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        held, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, held
+
+def memory_command(args):
+    os.environ.update({
+        "LOOKUP_CACHE_ENABLED": "false",
+        "LEDGER_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    })
+    import app
+
+    # Every title ends in ';', so every page becomes a job; cursor pages arrive as JSON
+    pages = [make_page(i, f"{synthetic_title(i)};", "2024-01-01T00:00:00.000Z") for i in range(args.pages)]
+    responses = [json.dumps({"results": pages[start:start + 100]}) for start in range(0, len(pages), 100)]
+    docs = [OpenLibraryStub.make_doc(synthetic_title(i), synthetic_isbn(i)) for i in range(args.pages)]
+    del pages
+
+    def scan_before():
+        # query_database() kept every page, then jobs were built from the list
+        kept = [page for response in responses for page in json.loads(response)["results"]]
+        return kept, [legacy_job(app, page) for page in kept]
+
+    def scan_after():
+        # Each cursor page is dropped as soon as its jobs are built
+        return [app.extract_book(page) for response in responses for page in json.loads(response)["results"]]
+
+    rows = []
+    for label, before, after, count in (
+        ("scan + jobs, per page", scan_before, scan_after, args.pages),
+        ("job records, per page",
+         lambda: [legacy_job(app, page) for response in responses for page in json.loads(response)["results"]],
+         scan_after, args.pages),
+        ("book metadata, per book", lambda: [app.parse_open_library_doc(doc, "q").to_dict() for doc in docs],
+         lambda: [app.parse_open_library_doc(doc, "q") for doc in docs], args.pages),
+    ):
+        _, held_before = traced_bytes(before)
+        _, held_after = traced_bytes(after)
+        rows.append((label, held_before / count, held_after / count))
+
+    print(f"{args.pages:,} pages with semicolon titles")
+    print(f"{'':<26}{'before B':>10}{'after B':>10}{'saved':>8}")
+    for label, before, after in rows:
+        print(f"{label:<26}{before:>10,.0f}{after:>10,.0f}{(1 - after / before) * 100:>7.0f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pipeline = subparsers.add_parser("pipeline", help="end-to-end process_books() against local stub APIs")
+    pipeline.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                          help="synthetic database sizes in pages")
+    pipeline.add_argument("--semicolon-ratio", type=float, default=0.01,
+                          help="fraction of pages whose titles end in ';'")
+    pipeline.add_argument("--isbn-ratio", type=float, default=0.2,
+                          help="fraction of semicolon titles that are ISBNs")
+    pipeline.add_argument("--latency", type=float, default=0.005, help="stub response latency in seconds")
+    pipeline.add_argument("--error-rate", type=float, default=0.0, help="fraction of stub requests that fail")
+    pipeline.add_argument("--miss-rate", type=float, default=0.1,
+                          help="fraction of queries each book provider has no result for")
+    pipeline.add_argument("--page-size", type=int, default=100, help="maximum Notion results per cursor page")
+    pipeline.add_argument("--concurrency", type=int, default=8, help="PROCESS_CONCURRENCY for the run")
+    pipeline.add_argument("--rate-limit", type=float, default=10000,
+                          help="requests/sec for every API limiter (high by default to measure the pipeline)")
+    pipeline.add_argument("--hedge", action="store_true",
+                          help="hedge lookups (HEDGED_LOOKUP) instead of the sequential fallback chain")
+    pipeline.add_argument("--isbn-batch-size", type=int, default=40,
+                          help="ISBN_BATCH_SIZE for the run (1 disables batching)")
+    pipeline.add_argument("--google-latency", type=float,
+                          help="latency for the Google Books stub only, e.g. to simulate a slow provider")
+    pipeline.add_argument("--google-error-rate", type=float,
+                          help="error rate for the Google Books stub only, e.g. 1 for an outage")
+    pipeline.add_argument("--no-routing", action="store_true",
+                          help="always call providers in the default order (PROVIDER_ROUTING=false)")
+    pipeline.add_argument("--engine", choices=["threads", "async"], default="threads",
+                          help="ENGINE for the run: the worker pool or the asyncio engine")
+    pipeline.add_argument("--workers", type=int, default=1,
+                          help="worker processes sharing the pages by shard and lease (WORKER_COUNT)")
+    pipeline.add_argument("--projection", choices=["on", "off", "compare"], default="on",
+                          help="FIELD_PROJECTION for the run, or run both ways and compare")
+    pipeline.set_defaults(func=pipeline_command)
+
+    classify = subparsers.add_parser("classifier", help="series and fiction classification cost per record")
+    classify.add_argument("--records", type=int, default=200000, help="synthetic records to classify")
+    classify.add_argument("--repeat", type=int, default=3, help="runs per implementation (best is reported)")
+    classify.set_defaults(func=classifier_command)
+
+    ranking = subparsers.add_parser("ranking", help="candidate ranking accuracy and cost on labeled searches")
+    ranking.add_argument("--min-score", type=float, default=0.3, help="MATCH_MIN_SCORE to evaluate")
+    ranking.add_argument("--repeat", type=int, default=2000, help="passes over the set when timing")
+    ranking.set_defaults(func=ranking_command)
+
+    memory = subparsers.add_parser("memory", help="memory held per scanned page and per book result")
+    memory.add_argument("--pages", type=int, default=100000, help="synthetic pages to scan")
+    memory.set_defaults(func=memory_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
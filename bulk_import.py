@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+"""
+Bulk import books into the Notion database from a CSV file or an ISBN list.
+
+Every entry is resolved with the same Google Books / Open Library lookups
+the extension uses, and a new page is created for it (with just the search
+text, if nothing was found). Progress is written to a checkpoint journal
+(one JSON line per finished entry), so running the same command again
+after an interruption skips what was already imported.
+
+    python bulk_import.py goodreads_library_export.csv
+    python bulk_import.py isbns.txt --tenant team-a
+
+CSV files need a header row; an ISBN13 or ISBN column is searched by ISBN,
+otherwise Title (plus Author, if present) is searched. Goodreads exports
+work as they are. Any other file is read as one ISBN or title per line.
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+
+import app
+from records import BookJob
+from tenants import FairScheduler
+
+logger = logging.getLogger("notion_books.import")
+
+# Journal statuses that are not retried when the import is resumed, once
+# their page exists ("not_found" rows get a page with just the search text)
+FINAL_STATUSES = {"created", "not_found"}
+
+class Journal:
+    """Append-only JSON lines checkpoint of finished entries.
+
+    Entries are keyed by row number and search text, so editing the input
+    file between runs re-imports the rows that changed. A page created just
+    before a crash, but not yet journaled, is created again on resume.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = self.load()
+        self._lock = threading.Lock()
+        self._file = open(path, "a")
+
+    def load(self):
+        done = {}
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short by a crash
+                if entry.get("status") in FINAL_STATUSES and entry.get("page_id"):
+                    done[entry["row"]] = entry["query"]
+        return done
+
+    def is_done(self, row, query):
+        return self.done.get(row) == query
+
+    def record(self, row, query, status, page_id=None):
+        line = json.dumps({"row": row, "query": query, "status": status, "page_id": page_id})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+def clean_cell(value):
+    # Goodreads wraps ISBNs as ="0439023483" so spreadsheets keep leading zeros
+    value = (value or "").strip()
+    if value.startswith('="') and value.endswith('"'):
+        value = value[2:-1]
+    return value.strip()
+
+def row_search_text(row):
+    """Pick the search text for a CSV row: its ISBN if it has one, else title and author."""
+    fields = {key.strip().lower(): clean_cell(value) for key, value in row.items() if key}
+    for key in ("isbn13", "isbn"):
+        if fields.get(key):
+            return fields[key]
+    title = fields.get("title") or fields.get("name") or ""
+    author = fields.get("author") or fields.get("authors") or ""
+    return f"{title} {author}".strip()
+
+def read_entries(path, input_format):
+    """Yield (row number, search text) for each entry, reading the file lazily."""
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        if input_format == "csv":
+            for number, row in enumerate(csv.DictReader(f), 1):
+                yield number, row_search_text(row)
+        else:
+            for number, line in enumerate(f, 1):
+                yield number, line.strip()
+
+def iter_import_books(path, input_format, journal, tenant, skipped):
+    """Yield a book job for every entry the journal doesn't mark as done."""
+    for number, text in read_entries(path, input_format):
+        if not text:
+            continue
+        if journal.is_done(number, text):
+            skipped.append(number)
+            continue
+        search_query, is_isbn = app.parse_search_text(text)
+        yield BookJob(None, text, search_query, is_isbn, tenant=tenant, row=number)
+
+def import_book(book, journal):
+    """Look up one entry, create its page and journal the outcome."""
+    book_data, book.book_data = book.book_data, None
+    book_data = book_data or app.lookup_book(book)
+    if not book_data:
+        # Still gets a page, with just the search text, so it can be fixed by hand
+        logger.info("Row %d: no book information found for '%s'", book.row, book.title)
+
+    page_id = app.create_notion_page(book_data, book.title, book.tenant)
+    if not page_id:
+        status = "failed"
+    else:
+        status = "created" if book_data else "not_found"
+    journal.record(book.row, book.title, status, page_id)
+    if page_id and book_data:
+        logger.info("Row %d: created '%s'", book.row, book_data.title)
+    return status
+
+def run_import(path, tenant, journal_path, input_format, concurrency):
+    """Import every entry of `path` and return a Counter of outcomes."""
+    journal = Journal(journal_path)
+    skipped = []
+    books = iter_import_books(path, input_format, journal, tenant, skipped)
+    if app.ISBN_BATCH_SIZE > 1:
+        books = app.batch_isbn_lookups(books)
+
+    # Notion calls go through the tenant's rate limiter, and 429s are retried
+    # after Retry-After, so the workers run as fast as Notion will accept
+    try:
+        lane = FairScheduler(concurrency).run({tenant: books}, lambda book: import_book(book, journal))[tenant]
+    finally:
+        journal.close()
+    if lane.error is not None:
+        raise lane.error
+
+    outcomes = Counter(lane.results)
+    outcomes["skipped"] = len(skipped)
+    return outcomes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV file, or a text file with one ISBN or title per line")
+    parser.add_argument("--format", choices=["auto", "csv", "lines"], default="auto",
+                        help="input format (default: csv for .csv files, lines otherwise)")
+    parser.add_argument("--journal", help="checkpoint journal path (default: <input>.journal.jsonl)")
+    parser.add_argument("--tenant", help="tenant to import into (default: the first configured one)")
+    parser.add_argument("--concurrency", type=int, default=app.PROCESS_CONCURRENCY,
+                        help="entries looked up and created in parallel (default: PROCESS_CONCURRENCY)")
+    args = parser.parse_args()
+
+    tenant = app.get_tenant()
+    if args.tenant:
+        tenant = app.tenants_by_name.get(args.tenant)
+        if tenant is None:
+            parser.error(f"unknown tenant {args.tenant!r}")
+
+    input_format = args.format
+    if input_format == "auto":
+        input_format = "csv" if args.input.lower().endswith(".csv") else "lines"
+    journal_path = args.journal or f"{args.input}.journal.jsonl"
+
+    outcomes = run_import(args.input, tenant, journal_path, input_format, args.concurrency)
+    print(f"Created {outcomes['created']} page(s), {outcomes['not_found']} not found (given a bare page), "
+          f"{outcomes['failed']} failed, {outcomes['skipped']} already imported")
+    if outcomes["failed"]:
+        print(f"Run the same command again to retry the failed entries (journal: {journal_path})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from records import BookRecord
+
+class LookupCache:
+    """On-disk cache of parsed book lookups, keyed on provider and query.
+
+    Entries expire after a TTL and the least recently used entries are
+    evicted once the cache grows past `max_entries`. Lookups that found
+    nothing are cached too, with their own (usually shorter) TTL.
+
+    Hits only write when an entry's `last_used` is more than
+    `touch_interval` seconds old, so recency is that coarse but most hits
+    are read-only. The entry count is kept in memory and only recounted
+    when it passes the cap; eviction then goes down to `EVICT_TO` of it,
+    so it runs once per many inserts even with other processes writing.
+    """
+
+    EVICT_TO = 0.9
+
+    def __init__(self, path, ttl, max_entries, negative_ttl=None, touch_interval=300):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = ttl if negative_ttl is None else negative_ttl
+        self.max_entries = max_entries
+        self.touch_interval = touch_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS lookups (
+                provider TEXT NOT NULL,
+                query TEXT NOT NULL,
+                book_data TEXT,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (provider, query)
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS lookups_last_used ON lookups (last_used)")
+        self._conn.commit()
+        self._entries = self._count()
+
+    @staticmethod
+    def normalize_query(query):
+        """Normalize a search query so trivially different spellings share an entry."""
+        return re.sub(r"\s+", " ", query).strip().lower()
+
+    def get(self, provider, query):
+        """Return (found, book_data) for a cached lookup.
+
+        `found` is False on a miss; `book_data` may be None when the
+        cached lookup found no book.
+        """
+        key = self.normalize_query(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT book_data, expires_at, last_used FROM lookups WHERE provider = ? AND query = ?",
+                (provider, key),
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM lookups WHERE provider = ? AND query = ?", (provider, key))
+                    self._conn.commit()
+                self.misses += 1
+                return False, None
+            if now - row[2] > self.touch_interval:
+                self._conn.execute(
+                    "UPDATE lookups SET last_used = ? WHERE provider = ? AND query = ?",
+                    (now, provider, key),
+                )
+                self._conn.commit()
+            self.hits += 1
+        return True, BookRecord.from_dict(json.loads(row[0])) if row[0] is not None else None
+
+    def set(self, provider, query, book_data):
+        """Store a parsed lookup result, a BookRecord (or None for "not found")."""
+        key = self.normalize_query(query)
+        now = time.time()
+        ttl = self.ttl if book_data is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+        payload = json.dumps(book_data.to_dict()) if book_data is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO lookups (provider, query, book_data, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (provider, key, payload, now + ttl, now),
+            )
+            # Counts replacements too, so it can only overestimate; _evict() recounts
+            self._entries += 1
+            if self._entries > self.max_entries:
+                self._evict(now)
+            self._conn.commit()
+
+    def _count(self):
+        return self._conn.execute("SELECT COUNT(*) FROM lookups").fetchone()[0]
+
+    def _evict(self, now):
+        """Drop expired entries, then the least recently used ones down to EVICT_TO of the cap."""
+        self._conn.execute("DELETE FROM lookups WHERE expires_at <= ?", (now,))
+        count = self._count()
+        if count > self.max_entries:
+            keep = int(self.max_entries * self.EVICT_TO)
+            self._conn.execute(
+                "DELETE FROM lookups WHERE rowid IN "
+                "(SELECT rowid FROM lookups ORDER BY last_used ASC LIMIT ?)",
+                (count - keep,),
+            )
+            count = keep
+        self._entries = count
+
+    def stats(self):
+        """Return hit/miss counters for this process and the current entry count."""
+        with self._lock:
+            entries = self._count()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+        }
@@ -0,0 +1,95 @@
+import re
+
+# Common series patterns in titles, most specific first
+SERIES_PATTERNS = [
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Series(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Trilogy(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Saga(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Chronicles(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Sequence(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Duology(?:\s|$)",
+    r"(?:^|\s)(?:The\s)?(.*?)\s+Quartet(?:\s|$)",
+    r"Book\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
+    r"Volume\s+\d+\s+of\s+(?:the\s+)?(.*?)(?:\s|$)",
+    r"\((?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\)",
+    r"\[(?:The\s+)?(.*?)\s+(?:Series|Book|#)\s*\d*\]",
+]
+
+NON_FICTION_KEYWORDS = ["non-fiction", "nonfiction", "biography", "history",
+                        "science", "self-help", "business", "psychology",
+                        "philosophy", "politics"]
+
+FICTION_KEYWORDS = ["fiction", "novel", "fantasy", "sci-fi", "science fiction",
+                    "thriller", "mystery", "romance"]
+
+def compile_series_matcher(patterns):
+    """Combine the series patterns into one anchored alternation.
+
+    Alternatives are tried in list order at the start of the string, so the
+    result is the same as running `re.search` for each pattern in turn and
+    keeping the first hit, in one call. Patterns that can start with `^`
+    followed by a lazy group always have their leftmost match at position
+    0; the others get a lazy `.*?` prefix so they still find their own
+    leftmost match anywhere in the string. Each alternative's capture group
+    is named after its position.
+    """
+    alternatives = []
+    for index, pattern in enumerate(patterns):
+        # The first unescaped "(" that isn't already a (?...) group is the capture group
+        named = re.sub(r"(?<!\\)\((?!\?)", f"(?P<p{index}>", pattern, count=1)
+        alternatives.append(named if pattern.startswith("(?:^|\\s)") else f".*?{named}")
+    return re.compile("^(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+def compile_keyword_matcher(non_fiction, fiction):
+    """Match the first line containing any keyword, and say which list it came from.
+
+    Nonfiction keywords are tried before fiction ones on every line, so a
+    category mentioning both (e.g. "science fiction", which contains
+    "science") counts as nonfiction, exactly as the per-keyword loops did.
+    """
+    def alternation(keywords):
+        return "|".join(re.escape(keyword) for keyword in keywords)
+    return re.compile(
+        f"^(?:.*?(?P<nonfiction>{alternation(non_fiction)})|.*?(?P<fiction>{alternation(fiction)}))",
+        re.IGNORECASE | re.MULTILINE,
+    )
+
+SERIES_MATCHER = compile_series_matcher(SERIES_PATTERNS)
+KEYWORD_MATCHER = compile_keyword_matcher(NON_FICTION_KEYWORDS, FICTION_KEYWORDS)
+
+def match_series(text):
+    """Return (pattern index, series name) for the best series pattern in `text`, or None."""
+    if not text:
+        return None
+    match = SERIES_MATCHER.match(text)
+    if not match:
+        return None
+    return int(match.lastgroup[1:]), match.group(match.lastgroup).strip()
+
+def extract_series(*texts):
+    """Find a series name in the given texts (e.g. title, then subtitle).
+
+    Patterns are tried in priority order across all texts; for the same
+    pattern an earlier text wins.
+    """
+    best = None
+    for text in texts:
+        found = match_series(text)
+        if found and (best is None or found[0] < best[0]):
+            best = found
+    return best[1] if best else None
+
+def classify_fiction(categories, query):
+    """Decide "Fiction" or "Nonfiction" from provider categories, then the query."""
+    # Categories never contain newlines, so one multiline search checks them all in order
+    match = KEYWORD_MATCHER.search("\n".join(categories))
+    if match:
+        return "Nonfiction" if match.lastgroup == "nonfiction" else "Fiction"
+
+    # If still not determined, make a guess based on other factors
+    if "fiction" in query.lower():
+        return "Fiction"
+    if "non-fiction" in query.lower() or "nonfiction" in query.lower():
+        return "Nonfiction"
+    # Default to fiction if unknown
+    return "Fiction"
@@ -0,0 +1,134 @@
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# A 429 is refused before anything happens, so even a request that can't
+# safely be repeated (like creating a page) can be sent again after one
+UNSAFE_RETRY_STATUS_CODES = {429}
+
+logger = logging.getLogger("notion_books.http")
+
+class RequestCancelled(Exception):
+    """A request's `cancel` event was set before it was sent."""
+
+class HttpClient:
+    """Pooled HTTP client with timeouts and retry/backoff.
+
+    One keep-alive `requests.Session` is kept per host. Failed requests
+    (connection errors, timeouts, 429 and 5xx responses) are retried with
+    exponential backoff and full jitter; a `Retry-After` header from the
+    server takes precedence over the computed delay. Requests sent with
+    `idempotent=False` are only retried on 429, since after a timeout or a
+    5xx the server may already have acted on them.
+    """
+
+    def __init__(self, timeout=10, max_retries=4, backoff_base=0.5, backoff_max=30, pool_size=10, metrics=None):
+        self.metrics = metrics
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def session_for(self, url):
+        """Return the shared session for the URL's host, creating it on first use."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[host] = session
+        return session
+
+    def retry_delay(self, attempt, response=None):
+        """Seconds to wait before retry number `attempt` (starting at 1)."""
+        if response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.backoff_max)
+        # Full jitter: uniform between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+    def request(self, method, url, limiter=None, idempotent=True, cancel=None, **kwargs):
+        """Send a request, retrying transient failures.
+
+        Returns the last response (which may still be an error status once
+        retries are exhausted) or re-raises the last connection error.
+        Raises RequestCancelled if the `cancel` event is set while the
+        request is still waiting for the limiter or a retry.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        retry_statuses = RETRY_STATUS_CODES if idempotent else UNSAFE_RETRY_STATUS_CODES
+        session = self.session_for(url)
+        host = urlsplit(url).netloc
+        attempt = 0
+        while True:
+            if limiter and not limiter.acquire(cancel=cancel):
+                raise RequestCancelled(f"{method} {url}")
+            if cancel is not None and cancel.is_set():
+                raise RequestCancelled(f"{method} {url}")
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._count(host, error=type(e).__name__)
+                attempt += 1
+                if attempt > self.max_retries or not idempotent:
+                    raise
+                delay = self.retry_delay(attempt)
+                logger.warning("%s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+                time.sleep(delay)
+                continue
+
+            self._count(host, response.status_code)
+            if response.status_code not in retry_statuses:
+                return response
+            attempt += 1
+            if attempt > self.max_retries:
+                return response
+            delay = self.retry_delay(attempt, response)
+            logger.warning("%s %s returned %s, retrying in %.1fs", method, url, response.status_code, delay)
+            response.close()
+            time.sleep(delay)
+
+    def _count(self, host, status=None, error=None):
+        if not self.metrics:
+            return
+        if error:
+            # Transport errors never got a status code
+            self.metrics.inc("http_requests", host=host, error=error)
+        else:
+            self.metrics.inc("http_requests", host=host, status=status)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+def parse_retry_after(value):
+    """Parse a Retry-After header given in seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,168 @@
+import itertools
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("notion_books.jobs")
+
+class Job:
+    """A unit of background work and its status."""
+
+    def __init__(self, job_id, trigger):
+        self.id = job_id
+        self.triggers = [trigger]
+        self.page_ids = {}  # tenant name -> set of page IDs
+        self.scan_database = False
+        self.scan_tenants = set()  # names of the tenants to scan, or None for every tenant
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "triggers": list(self.triggers),
+            "page_ids": sorted(page_id for page_ids in self.page_ids.values() for page_id in page_ids),
+            "tenants": sorted(self.page_ids),
+            "scan_database": self.scan_database,
+            "scan_tenants": None if self.scan_tenants is None else sorted(self.scan_tenants),
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobQueue:
+    """Single background worker that runs jobs one at a time.
+
+    Triggers that arrive while a job is waiting are merged into it, so at
+    most one run is in progress and at most one follow-up run is queued no
+    matter how many triggers overlap.
+
+    With `background=False` there is no worker thread: `submit()` runs the
+    job in the calling thread and returns it finished, for servers that
+    don't run threads started by the app (e.g. uWSGI without threads).
+    """
+
+    def __init__(self, run, history_size=100, background=True):
+        self.run = run
+        self.history_size = history_size
+        self.background = background
+        self._ids = itertools.count(1)
+        self._lock = threading.Condition()
+        self._pending = None
+        self._running = None
+        self._history = OrderedDict()
+        self._worker = None
+
+    def submit(self, trigger, page_ids=None, scan_database=False, tenant=None):
+        """Queue a run for `trigger`, merging it into the waiting job if any.
+
+        A job processes the union of the page IDs of its merged triggers,
+        grouped by the name of the tenant they belong to, then scans the
+        databases any of them asked for: `tenant`'s, or every tenant's if
+        a scan names no tenant.
+        """
+        if not self.background:
+            return self._run_inline(trigger, page_ids, scan_database, tenant)
+        with self._lock:
+            job = self._pending
+            if job is not None:
+                job.triggers.append(trigger)
+            else:
+                job = Job(next(self._ids), trigger)
+            if page_ids:
+                job.page_ids.setdefault(tenant, set()).update(page_ids)
+            if scan_database:
+                job.scan_database = True
+                if tenant is None:
+                    job.scan_tenants = None
+                elif job.scan_tenants is not None:
+                    job.scan_tenants.add(tenant)
+            if job is self._pending:
+                return job
+            self._pending = job
+            self._remember(job)
+            self._ensure_worker()
+            self._lock.notify()
+            return job
+
+    def _run_inline(self, trigger, page_ids, scan_database, tenant):
+        with self._lock:
+            job = Job(next(self._ids), trigger)
+            if page_ids:
+                job.page_ids[tenant] = set(page_ids)
+            if scan_database:
+                job.scan_database = True
+                job.scan_tenants = None if tenant is None else {tenant}
+            self._remember(job)
+            self._start(job)
+        self._execute(job)
+        with self._lock:
+            self._finish(job)
+        job.done.set()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._history.get(job_id)
+
+    def jobs(self):
+        """Return recent jobs, newest first."""
+        with self._lock:
+            return list(reversed(self._history.values()))
+
+    def busy(self):
+        """True while a job is running or waiting to run."""
+        with self._lock:
+            return self._running is not None or self._pending is not None
+
+    def _remember(self, job):
+        self._history[job.id] = job
+        while len(self._history) > self.history_size:
+            self._history.popitem(last=False)
+
+    def _ensure_worker(self):
+        # Started lazily so importing the app (e.g. under WSGI) spawns no threads
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._work, name="job-worker", daemon=True)
+            self._worker.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                while self._pending is None:
+                    self._lock.wait()
+                job = self._pending
+                self._pending = None
+                self._start(job)
+            self._execute(job)
+            with self._lock:
+                self._finish(job)
+            job.done.set()
+
+    def _start(self, job):
+        self._running = job
+        job.status = "running"
+        job.started_at = time.time()
+
+    def _execute(self, job):
+        try:
+            job.result = self.run(job)
+            job.status = "succeeded"
+        except Exception as e:
+            logger.exception("Job %d failed", job.id)
+            job.error = str(e)
+            job.status = "failed"
+
+    def _finish(self, job):
+        job.finished_at = time.time()
+        if self._running is job:
+            self._running = None
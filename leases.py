@@ -0,0 +1,172 @@
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger("notion_books.leases")
+
+def shard_of(page_id, shards):
+    """Stable shard number for a page ID, the same in every process (unlike hash())."""
+    # Webhooks and queries don't always agree on dashes or case in IDs
+    return zlib.crc32(page_id.replace("-", "").lower().encode()) % shards
+
+class LeaseStore:
+    """Page leases and worker heartbeats shared by processes through one SQLite file.
+
+    Pages are split between `shards` workers by a hash of the page ID, and
+    this worker is number `shard`. A worker only processes a page while it
+    holds the page's lease, so two processes never work on the same page
+    at once. A lease lasts `ttl` seconds. A background heartbeat renews
+    this worker's leases and its shard's heartbeat every `ttl / 4`
+    seconds, so a lease only expires when its holder has died or hung.
+
+    Pages of a shard whose heartbeat is older than `ttl` are taken over by
+    whichever live worker sees them first, until that shard's worker comes
+    back. A shard that has never sent a heartbeat counts as live for the
+    first `ttl` seconds, so workers starting together don't grab each
+    other's pages.
+    """
+
+    def __init__(self, path, ttl, owner, shard=0, shards=1):
+        self.path = path
+        self.ttl = ttl
+        self.owner = owner
+        self.shard = shard
+        self.shards = shards
+        self.started = time.time()
+        self.claimed = 0
+        self.taken_over = 0
+        self.skipped = 0
+        self._held = set()
+        self._live_shards = set(range(shards))
+        self._lock = threading.Lock()
+        # Transactions are explicit so a claim's read and write happen under one write lock
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS leases (
+                tenant TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (tenant, page_id)
+            )"""
+        )
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS shards (
+                shard INTEGER PRIMARY KEY,
+                owner TEXT NOT NULL,
+                heartbeat_at REAL NOT NULL
+            )"""
+        )
+        self.heartbeat()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name="lease-heartbeat", daemon=True)
+        self._thread.start()
+
+    def claim(self, tenant, page_id):
+        """Try to take the lease on a page for this worker.
+
+        Returns "claimed" or "taken_over" (from a stopped worker) when this
+        worker should process the page, or "other_shard" / "leased" when
+        another worker is responsible for it.
+        """
+        shard = shard_of(page_id, self.shards)
+        if shard != self.shard and shard in self._live_shards:
+            with self._lock:
+                self.skipped += 1
+            return "other_shard"
+
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT owner, expires_at FROM leases WHERE tenant = ? AND page_id = ?",
+                    (tenant, page_id),
+                ).fetchone()
+                if row is not None and row[0] != self.owner and row[1] > now:
+                    self._conn.execute("COMMIT")
+                    self.skipped += 1
+                    return "leased"
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (tenant, page_id, owner, expires_at) VALUES (?, ?, ?, ?)",
+                    (tenant, page_id, self.owner, now + self.ttl),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._held.add((tenant, page_id))
+            if shard != self.shard or (row is not None and row[0] != self.owner):
+                self.taken_over += 1
+                return "taken_over"
+            self.claimed += 1
+            return "claimed"
+
+    def release(self, tenant, page_id):
+        """Give up the lease on a page once it has been processed."""
+        with self._lock:
+            if (tenant, page_id) not in self._held:
+                return
+            self._held.discard((tenant, page_id))
+            self._conn.execute(
+                "DELETE FROM leases WHERE tenant = ? AND page_id = ? AND owner = ?",
+                (tenant, page_id, self.owner),
+            )
+
+    def heartbeat(self):
+        """Renew this worker's leases and heartbeat, and see which shards are still alive."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "UPDATE leases SET expires_at = ? WHERE tenant = ? AND page_id = ? AND owner = ?",
+                    [(now + self.ttl, tenant, page_id, self.owner) for tenant, page_id in self._held],
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO shards (shard, owner, heartbeat_at) VALUES (?, ?, ?)",
+                    (self.shard, self.owner, now),
+                )
+                heartbeats = dict(self._conn.execute("SELECT shard, heartbeat_at FROM shards").fetchall())
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            live = {
+                shard for shard in range(self.shards)
+                if now - heartbeats.get(shard, self.started) < self.ttl
+            }
+            for shard in sorted(self._live_shards - live):
+                logger.warning("Worker %d stopped sending heartbeats, taking over its pages", shard)
+            for shard in sorted(live - self._live_shards):
+                logger.info("Worker %d is back, leaving its pages to it", shard)
+            self._live_shards = live
+
+    def _beat(self):
+        while not self._stopped.wait(self.ttl / 4):
+            try:
+                self.heartbeat()
+            except sqlite3.Error as e:
+                logger.warning("Lease heartbeat failed: %s", e)
+
+    def close(self):
+        """Stop the heartbeat; leases still held expire after the TTL."""
+        self._stopped.set()
+        self._thread.join()
+
+    def stats(self):
+        """Return this worker's shard, leases held and claim counts."""
+        with self._lock:
+            return {
+                "owner": self.owner,
+                "shard": self.shard,
+                "shards": self.shards,
+                "live_shards": sorted(self._live_shards),
+                "held": len(self._held),
+                "claimed": self.claimed,
+                "taken_over": self.taken_over,
+                "skipped": self.skipped,
+            }
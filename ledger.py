@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+import time
+
+class WorkLedger:
+    """On-disk record of books that could not be finished, with backoff.
+
+    Each (tenant, page) that failed keeps its attempt count, last outcome
+    and the time it may next be retried. The delay doubles with every
+    failed attempt, from `backoff_base` up to `backoff_max` seconds. A
+    success removes the entry. Editing the search text makes the page due
+    straight away and starts the count over, since a corrected title
+    deserves an immediate retry.
+    """
+
+    def __init__(self, path, backoff_base, backoff_max):
+        self.path = path
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS ledger (
+                tenant TEXT NOT NULL,
+                page_id TEXT NOT NULL,
+                query TEXT NOT NULL,
+                attempts INTEGER NOT NULL,
+                last_outcome TEXT NOT NULL,
+                last_attempt REAL NOT NULL,
+                next_retry_at REAL NOT NULL,
+                PRIMARY KEY (tenant, page_id)
+            )"""
+        )
+        self._conn.commit()
+
+    def retry_delay(self, attempts):
+        """Seconds to wait after `attempts` failed attempts in a row."""
+        return min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+
+    def is_due(self, tenant, page_id, query):
+        """True if the page has no pending backoff for this search text."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT query, next_retry_at FROM ledger WHERE tenant = ? AND page_id = ?",
+                (tenant, page_id),
+            ).fetchone()
+            if row is None or row[0] != query or row[1] <= time.time():
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, tenant, page_id, query, outcome, success):
+        """Record the outcome of an attempt and schedule the next one if it failed."""
+        now = time.time()
+        with self._lock:
+            if success:
+                self._conn.execute("DELETE FROM ledger WHERE tenant = ? AND page_id = ?", (tenant, page_id))
+                self._conn.commit()
+                return
+            row = self._conn.execute(
+                "SELECT query, attempts FROM ledger WHERE tenant = ? AND page_id = ?",
+                (tenant, page_id),
+            ).fetchone()
+            # A changed search text starts the count over
+            attempts = row[1] + 1 if row is not None and row[0] == query else 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ledger "
+                "(tenant, page_id, query, attempts, last_outcome, last_attempt, next_retry_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (tenant, page_id, query, attempts, outcome, now, now + self.retry_delay(attempts)),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        """Return how many pages are backing off, by last outcome."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT last_outcome, COUNT(*), SUM(next_retry_at > ?) FROM ledger GROUP BY last_outcome",
+                (now,),
+            ).fetchall()
+        return {
+            "entries": sum(row[1] for row in rows),
+            "waiting": sum(row[2] or 0 for row in rows),
+            "by_outcome": {row[0]: row[1] for row in rows},
+            "skipped": self.skipped,
+        }
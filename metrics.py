@@ -0,0 +1,105 @@
+import threading
+import time
+from contextlib import contextmanager
+
+class Metrics:
+    """Minimal thread-safe metrics registry rendered in Prometheus text format.
+
+    Counters are monotonically increasing totals; timers record a count and
+    a sum of seconds (a Prometheus summary without quantiles). Gauges are
+    read from callbacks at render time so values owned elsewhere (e.g. the
+    lookup cache) don't need to be mirrored.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._timers = {}
+        self._gauges = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = metric_key(name, labels)
+        with self._lock:
+            count, total = self._timers.get(key, (0, 0.0))
+            self._timers[key] = (count + 1, total + seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Time the body of a `with` block, recording it even if it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def gauge(self, name, callback, **labels):
+        """Register a callback returning the current value of a gauge."""
+        with self._lock:
+            self._gauges[metric_key(name, labels)] = callback
+
+    def snapshot(self):
+        """Return counters and timers as plain dicts (handy for tests and logs)."""
+        with self._lock:
+            return dict(self._counters), dict(self._timers)
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            timers = sorted(self._timers.items())
+            gauges = sorted(self._gauges.items(), key=lambda item: item[0])
+
+        lines = []
+        seen = set()
+
+        def header(name, metric, kind):
+            if metric in seen:
+                return
+            seen.add(metric)
+            if name in self._help:
+                lines.append(f"# HELP {metric} {self._help[name]}")
+            lines.append(f"# TYPE {metric} {kind}")
+
+        for (name, labels), value in counters:
+            metric = f"{self.prefix}_{name}_total"
+            header(name, metric, "counter")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        for (name, labels), (count, total) in timers:
+            metric = f"{self.prefix}_{name}_seconds"
+            header(name, metric, "summary")
+            lines.append(f"{metric}_count{format_labels(labels)} {count}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {total:.6f}")
+        for (name, labels), callback in gauges:
+            try:
+                value = callback()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            metric = f"{self.prefix}_{name}"
+            header(name, metric, "gauge")
+            lines.append(f"{metric}{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def metric_key(name, labels):
+    # Label values are kept as strings, so keys always sort (a status can be 200 or "error")
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
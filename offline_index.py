@@ -0,0 +1,437 @@
+#!/usr/bin/env python
+"""
+Local book index built from the Open Library data dumps.
+
+The build command streams the (gzipped) authors, works and editions dumps
+from https://openlibrary.org/developers/dumps into a single SQLite file:
+an ISBN table for exact lookups and an FTS5 index over titles and authors.
+Point LOCAL_INDEX_PATH at the result and app.py answers lookups from it
+before asking Google Books or Open Library.
+
+    python offline_index.py build --authors ol_dump_authors_latest.txt.gz \\
+        --works ol_dump_works_latest.txt.gz --editions ol_dump_editions_latest.txt.gz \\
+        --output ol_index.sqlite3
+    python offline_index.py search ol_index.sqlite3 "the left hand of darkness"
+
+Only --editions is required; without the works dump each edition stands in
+for its own work, and without the authors dump author names are missing.
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+import sqlite3
+import statistics
+import threading
+import time
+
+from ranking import isbn13
+
+logger = logging.getLogger("notion_books.offline_index")
+
+BATCH_SIZE = 10000
+MAX_DESCRIPTION_LENGTH = 2000  # Notion's rich text limit, so nothing longer is ever written
+MAX_SUBJECTS = 20
+MAX_WORK_ISBNS = 5
+YEAR_PATTERN = re.compile(r"\b(1[0-9]{3}|20[0-9]{2})\b")
+
+SCHEMA = """
+CREATE TABLE authors (
+    key TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE works (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    title_key TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    subjects TEXT,
+    series TEXT,
+    description TEXT,
+    first_publish_year INTEGER,
+    cover_id INTEGER,
+    edition_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE isbns (
+    isbn TEXT PRIMARY KEY,
+    work_id INTEGER NOT NULL,
+    pages INTEGER,
+    cover_id INTEGER,
+    publish_year INTEGER
+) WITHOUT ROWID;
+"""
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def read_dump(path):
+    """Yield the JSON record of every line of an Open Library dump file.
+
+    Dump lines are tab separated: type, key, revision, last modified, JSON.
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\n").split("\t", 4)
+            if len(parts) < 5:
+                continue
+            try:
+                yield json.loads(parts[4])
+            except ValueError:
+                continue
+
+def text_of(value):
+    # Descriptions are either plain strings or {"type": "/type/text", "value": ...}
+    if isinstance(value, dict):
+        value = value.get("value")
+    return value if isinstance(value, str) else None
+
+def year_of(value):
+    match = YEAR_PATTERN.search(str(value or ""))
+    return int(match.group(1)) if match else None
+
+def first_cover(record):
+    covers = [cover for cover in record.get("covers") or [] if isinstance(cover, int) and cover > 0]
+    return covers[0] if covers else None
+
+def normalize_isbn(value):
+    """Return an ISBN as ISBN-13, or None if it isn't one."""
+    # Stored and looked up in this form, so either form finds an edition that lists only the other
+    isbn = re.sub(r"[^0-9Xx]", "", str(value)).upper()
+    return isbn13(isbn) if len(isbn) in (10, 13) else None
+
+def title_key(text):
+    """Normalize a title for exact matching: lowercase words separated by single spaces."""
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+def in_batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class IndexBuilder:
+    """Stream dump files into a new index database."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A half-built index is thrown away anyway, so skip durability while loading
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.executescript(SCHEMA)
+
+    def author_names(self, keys):
+        names = []
+        for key in keys:
+            row = self.conn.execute("SELECT name FROM authors WHERE key = ?", (key,)).fetchone()
+            if row:
+                names.append(row[0])
+        return names
+
+    def add_authors(self, path):
+        rows = (
+            (record["key"], record["name"])
+            for record in read_dump(path)
+            if record.get("key") and isinstance(record.get("name"), str)
+        )
+        return self._insert("INSERT OR REPLACE INTO authors (key, name) VALUES (?, ?)", rows)
+
+    def work_row(self, record, author_keys):
+        subjects = [subject for subject in record.get("subjects") or [] if isinstance(subject, str)]
+        series = [series for series in record.get("series") or [] if isinstance(series, str)]
+        description = text_of(record.get("description"))
+        return (
+            record["key"],
+            record["title"],
+            title_key(record["title"]),
+            json.dumps(self.author_names(author_keys)),
+            json.dumps(subjects[:MAX_SUBJECTS]) if subjects else None,
+            json.dumps(series) if series else None,
+            description[:MAX_DESCRIPTION_LENGTH] if description else None,
+            year_of(record.get("first_publish_date")),
+            first_cover(record),
+        )
+
+    def add_works(self, path):
+        def rows():
+            for record in read_dump(path):
+                if not record.get("key") or not isinstance(record.get("title"), str):
+                    continue
+                author_keys = [
+                    (entry.get("author") or {}).get("key")
+                    for entry in record.get("authors") or []
+                    if isinstance(entry, dict) and isinstance(entry.get("author"), dict)
+                ]
+                yield self.work_row(record, author_keys)
+        return self._insert(
+            "INSERT OR IGNORE INTO works "
+            "(key, title, title_key, authors, subjects, series, description, first_publish_year, cover_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows(),
+        )
+
+    def work_id(self, edition):
+        """ID of the edition's work, adding the edition as its own work if there is none."""
+        for work in edition.get("works") or []:
+            row = self.conn.execute("SELECT id FROM works WHERE key = ?", (work.get("key"),)).fetchone()
+            if row:
+                return row[0]
+        if not isinstance(edition.get("title"), str):
+            return None
+        author_keys = [author.get("key") for author in edition.get("authors") or [] if isinstance(author, dict)]
+        row = self.work_row({**edition, "first_publish_date": edition.get("publish_date")}, author_keys)
+        cursor = self.conn.execute(
+            "INSERT OR IGNORE INTO works "
+            "(key, title, title_key, authors, subjects, series, description, first_publish_year, cover_id) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            row,
+        )
+        if cursor.rowcount:
+            return cursor.lastrowid
+        return self.conn.execute("SELECT id FROM works WHERE key = ?", (edition["key"],)).fetchone()[0]
+
+    def add_editions(self, path):
+        count = 0
+        for batch in in_batches(read_dump(path)):
+            rows = []
+            editions = {}
+            for edition in batch:
+                isbns = {normalize_isbn(isbn) for isbn in (edition.get("isbn_13") or []) + (edition.get("isbn_10") or [])}
+                isbns.discard(None)
+                if not isbns or not edition.get("key"):
+                    continue
+                work_id = self.work_id(edition)
+                if work_id is None:
+                    continue
+                editions[work_id] = editions.get(work_id, 0) + 1
+                pages = edition.get("number_of_pages")
+                pages = pages if isinstance(pages, int) and pages > 0 else None
+                for isbn in isbns:
+                    rows.append((isbn, work_id, pages, first_cover(edition), year_of(edition.get("publish_date"))))
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO isbns (isbn, work_id, pages, cover_id, publish_year) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self.conn.executemany(
+                "UPDATE works SET edition_count = edition_count + ? WHERE id = ?",
+                [(editions_count, work_id) for work_id, editions_count in editions.items()],
+            )
+            self.conn.commit()
+            count += len(rows)
+        return count
+
+    def _insert(self, sql, rows):
+        count = 0
+        for batch in in_batches(rows):
+            self.conn.executemany(sql, batch)
+            self.conn.commit()
+            count += len(batch)
+        return count
+
+    def finish(self):
+        """Build the search indexes and compact the file."""
+        self.conn.executescript("""
+            DROP TABLE authors;
+            CREATE INDEX isbns_work ON isbns (work_id);
+            CREATE INDEX works_title_key ON works (title_key, edition_count);
+            CREATE VIRTUAL TABLE works_fts USING fts5(
+                title, authors, content='works', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            );
+            INSERT INTO works_fts (works_fts) VALUES ('rebuild');
+            INSERT INTO works_fts (works_fts) VALUES ('optimize');
+        """)
+        self.conn.commit()
+        self.conn.execute("VACUUM")
+        self.conn.close()
+
+def build_index(output, editions, works=None, authors=None):
+    """Build an index at `output` from the dump files, replacing it atomically."""
+    tmp_path = f"{output}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    builder = IndexBuilder(tmp_path)
+    if authors:
+        started = time.perf_counter()
+        logger.info("Loaded %d authors in %.0fs", builder.add_authors(authors), time.perf_counter() - started)
+    if works:
+        started = time.perf_counter()
+        logger.info("Loaded %d works in %.0fs", builder.add_works(works), time.perf_counter() - started)
+    started = time.perf_counter()
+    logger.info("Loaded %d ISBNs in %.0fs", builder.add_editions(editions), time.perf_counter() - started)
+    builder.finish()
+    os.replace(tmp_path, output)
+
+# ---------------------------------------------------------------------------
+# Searching
+# ---------------------------------------------------------------------------
+
+class OfflineIndex:
+    """Read-only access to an index built by build_index().
+
+    Results are returned as Open Library search docs (title, author_name,
+    isbn, ...) so app.py can parse them exactly like a remote result.
+    Each thread gets its own connection; the file is memory-mapped.
+    """
+
+    def __init__(self, path, mmap_size=256 * 1024 * 1024):
+        self.path = path
+        self.mmap_size = mmap_size
+        self._local = threading.local()
+        self.connection()  # Fail early if the file is missing or not an index
+
+    def connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+            conn.execute("SELECT 1 FROM works_fts LIMIT 1")
+            self._local.conn = conn
+        return conn
+
+    def work_doc(self, work_id, isbn=None):
+        conn = self.connection()
+        row = conn.execute(
+            "SELECT key, title, authors, subjects, series, description, first_publish_year, cover_id "
+            "FROM works WHERE id = ?",
+            (work_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        key, title, authors, subjects, series, description, year, cover_id = row
+
+        if isbn:
+            # An ISBN lookup describes that edition: its pages, cover and ISBN
+            editions = conn.execute(
+                "SELECT isbn, pages, cover_id, publish_year FROM isbns WHERE isbn = ?", (isbn,)
+            ).fetchall()
+        else:
+            editions = conn.execute(
+                "SELECT isbn, pages, cover_id, publish_year FROM isbns WHERE work_id = ? LIMIT 50",
+                (work_id,),
+            ).fetchall()
+        pages = [edition[1] for edition in editions if edition[1]]
+        edition_cover = next((edition[2] for edition in editions if edition[2]), None)
+
+        doc = {
+            "key": key,
+            "title": title,
+            "author_name": json.loads(authors),
+            # ISBN-13s first, the order app.py prefers them in
+            "isbn": sorted((edition[0] for edition in editions), key=len, reverse=True)[:MAX_WORK_ISBNS],
+        }
+        if subjects:
+            doc["subject"] = json.loads(subjects)
+        if series:
+            doc["series"] = json.loads(series)
+        if description:
+            doc["description"] = description
+        year = year or min((edition[3] for edition in editions if edition[3]), default=None)
+        if year:
+            doc["first_publish_year"] = year
+        cover_id = (edition_cover or cover_id) if isbn else (cover_id or edition_cover)
+        if cover_id:
+            doc["cover_i"] = cover_id
+        if pages:
+            doc["number_of_pages_median"] = int(statistics.median(pages))
+        return doc
+
+    def lookup_isbn(self, isbn):
+        """Return the search doc for an ISBN (10 or 13 digits), or None."""
+        digits = re.sub(r"[^0-9Xx]", "", str(isbn)).upper()
+        isbn = normalize_isbn(digits)
+        if not isbn:
+            return None
+        # Indexes built before ISBNs were stored as ISBN-13 may still hold the ISBN-10 as given
+        row = self.connection().execute(
+            "SELECT isbn, work_id FROM isbns WHERE isbn IN (?, ?)", (isbn, digits)
+        ).fetchone()
+        return self.work_doc(row[1], row[0]) if row else None
+
+    def search(self, text, candidates=10):
+        """Return the best search doc for a title (and optionally author) query, or None."""
+        docs = self.search_candidates(text, candidates)
+        return docs[0] if docs else None
+
+    def search_candidates(self, text, candidates=10):
+        """Return up to `candidates` search docs for a title query, best first.
+
+        Exact title matches are answered from an index. Otherwise every
+        word has to match the title or authors. Either way works with more
+        editions come first, so the well-known book beats an obscure one
+        with the same title. Callers rank the docs again against the query,
+        like a remote provider's results.
+        """
+        words = re.findall(r"\w+", text.lower())
+        if not words:
+            return []
+        rows = self.connection().execute(
+            "SELECT id FROM works WHERE title_key = ? ORDER BY edition_count DESC LIMIT ?",
+            (" ".join(words), candidates),
+        ).fetchall()
+        if rows:
+            work_ids = [row[0] for row in rows]
+        else:
+            match = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+            rows = self.connection().execute(
+                "SELECT works.id, bm25(works_fts, 10.0, 1.0), works.edition_count "
+                "FROM works_fts JOIN works ON works.id = works_fts.rowid "
+                "WHERE works_fts MATCH ? ORDER BY bm25(works_fts, 10.0, 1.0) LIMIT ?",
+                (match, candidates),
+            ).fetchall()
+            # bm25 scores are negative, lower is better
+            rows.sort(key=lambda row: row[1] - 0.5 * (row[2] or 0) ** 0.5)
+            work_ids = [row[0] for row in rows]
+        docs = (self.work_doc(work_id) for work_id in work_ids)
+        return [doc for doc in docs if doc is not None]
+
+# ---------------------------------------------------------------------------
+# Command line
+# ---------------------------------------------------------------------------
+
+def build_command(args):
+    build_index(args.output, args.editions, works=args.works, authors=args.authors)
+    print(f"Index written to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB)")
+
+def search_command(args):
+    index = OfflineIndex(args.index)
+    started = time.perf_counter()
+    query = args.query
+    doc = index.lookup_isbn(query[len("isbn:"):] if query.startswith("isbn:") else query)
+    if doc is None:
+        doc = index.search(query)
+    elapsed = time.perf_counter() - started
+    print(json.dumps(doc, indent=2))
+    print(f"({elapsed * 1000:.2f} ms)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="build an index from Open Library dump files")
+    build.add_argument("--editions", required=True, help="editions dump (.txt or .txt.gz)")
+    build.add_argument("--works", help="works dump (.txt or .txt.gz)")
+    build.add_argument("--authors", help="authors dump (.txt or .txt.gz)")
+    build.add_argument("--output", default="ol_index.sqlite3", help="index file to write")
+    build.set_defaults(func=build_command)
+
+    search = subparsers.add_parser("search", help="look up an ISBN or title in an index")
+    search.add_argument("index", help="index file")
+    search.add_argument("query", help="ISBN or title")
+    search.set_defaults(func=search_command)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
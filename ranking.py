@@ -0,0 +1,86 @@
+import re
+import unicodedata
+
+# Each step down a provider's own result list costs this much score, so the
+# provider's relevance order breaks ties between equally good matches
+POSITION_PENALTY = 0.02
+
+# How much of a match is about explaining the whole search term (title and
+# author words) versus the title not having much beyond what was searched for
+RECALL_WEIGHT = 0.7
+PRECISION_WEIGHT = 0.3
+
+# Letters and digits of any script are kept, so Cyrillic or CJK titles match too
+NON_WORD = re.compile(r"[\W_]+")
+
+def normalize(text):
+    """Casefold, strip accents and punctuation, and collapse whitespace."""
+    text = text or ""
+    if not text.isascii():
+        text = unicodedata.normalize("NFKD", text)
+        text = "".join(char for char in text if not unicodedata.combining(char))
+    return NON_WORD.sub(" ", text.casefold()).strip()
+
+def trigrams(text):
+    """Character trigrams of each word, padded so short words and word edges count."""
+    grams = set()
+    for word in normalize(text).split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def isbn13(isbn):
+    """Convert an ISBN-10 to ISBN-13 so either form of the same book compares equal."""
+    isbn = isbn.replace("-", "").upper()
+    if len(isbn) != 10 or not isbn[:9].isdigit():
+        return isbn
+    core = "978" + isbn[:9]
+    total = sum(int(digit) * (1 if i % 2 == 0 else 3) for i, digit in enumerate(core))
+    return core + str((10 - total % 10) % 10)
+
+class PreparedQuery:
+    """A search term broken down once, then compared against every candidate."""
+
+    __slots__ = ("grams", "isbn")
+
+    def __init__(self, query):
+        if query.startswith("isbn:"):
+            self.isbn = isbn13(query[len("isbn:"):])
+            self.grams = set()
+        else:
+            self.isbn = None
+            self.grams = trigrams(query)
+
+def match_score(prepared, title, subtitle, authors, isbns):
+    """Score how well a candidate book matches a prepared search term, from 0 to about 1.
+
+    An ISBN search that finds the same ISBN in the candidate scores 1 plus
+    its title score, so it always beats candidates without it.
+    """
+    title_grams = trigrams(title)
+    score = 0.0
+    if prepared.grams and title_grams:
+        found = title_grams | trigrams(subtitle) | trigrams(" ".join(authors))
+        recall = len(prepared.grams & found) / len(prepared.grams)
+        precision = len(title_grams & prepared.grams) / len(title_grams)
+        score = RECALL_WEIGHT * recall + PRECISION_WEIGHT * precision
+    if prepared.isbn and any(isbn13(isbn) == prepared.isbn for isbn in isbns):
+        score += 1.0
+    return score
+
+def rank_results(query, results, describe, min_score):
+    """Return the provider results that match `query`, best first.
+
+    `describe(result)` returns a result's (title, subtitle, authors, isbns).
+    Title searches drop results scoring below `min_score`. ISBN searches
+    keep every result, because the provider already matched on the ISBN;
+    results that list the ISBN are ranked first.
+    """
+    prepared = PreparedQuery(query)
+    scored = []
+    for position, result in enumerate(results):
+        score = match_score(prepared, *describe(result)) - POSITION_PENALTY * position
+        if prepared.isbn or score >= min_score:
+            scored.append((-score, position, result))
+    scored.sort(key=lambda entry: entry[:2])
+    return [result for _, _, result in scored]
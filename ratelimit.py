@@ -0,0 +1,50 @@
+import threading
+import time
+
+class TokenBucket:
+    """Thread-safe token bucket limiter.
+
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    `acquire()` blocks until a token is available (or a `cancel` event is
+    set); `try_acquire()` says how long to wait instead, for callers that
+    sleep some other way.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take `tokens` tokens if available and return 0, else return the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1, cancel=None):
+        """Block until `tokens` tokens are available, then take them.
+
+        Returns True once they are taken, or False without taking any if
+        the `cancel` event is set first.
+        """
+        while True:
+            if cancel is not None and cancel.is_set():
+                return False
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if cancel is None:
+                time.sleep(wait)
+            else:
+                cancel.wait(wait)
@@ -0,0 +1,57 @@
+class BookJob:
+    """One entry to look up: where it came from and what to search for.
+
+    Built from a Notion page as soon as its title is read (or from a bulk
+    import row), so the page JSON itself doesn't outlive the scan.
+    `current` is the page's snapshot_page() for diffing updates, `book_data`
+    a BookRecord already resolved by an ISBN batch, and `row` the bulk
+    import row number.
+    """
+
+    __slots__ = ("id", "title", "search_query", "is_isbn", "current", "tenant", "book_data", "row")
+
+    def __init__(self, id, title, search_query, is_isbn, current=None, tenant=None, book_data=None, row=None):
+        self.id = id
+        self.title = title
+        self.search_query = search_query
+        self.is_isbn = is_isbn
+        self.current = current
+        self.tenant = tenant
+        self.book_data = book_data
+        self.row = row
+
+    def __repr__(self):
+        return f"BookJob({self.id!r}, {self.search_query!r})"
+
+class BookRecord:
+    """Book metadata from one provider, normalized to what gets written to Notion."""
+
+    __slots__ = ("title", "authors", "description", "categories", "rating", "page_count", "info_link",
+                 "image_link", "published_date", "fiction_status", "series_name", "isbn")
+
+    def __init__(self, title="", authors=(), description="", categories=(), rating=0, page_count=0,
+                 info_link="", image_link="", published_date=None, fiction_status=None, series_name=None,
+                 isbn=None):
+        self.title = title
+        self.authors = authors
+        self.description = description
+        self.categories = categories
+        self.rating = rating
+        self.page_count = page_count
+        self.info_link = info_link
+        self.image_link = image_link
+        self.published_date = published_date
+        self.fiction_status = fiction_status
+        self.series_name = series_name
+        self.isbn = isbn
+
+    def __repr__(self):
+        return f"BookRecord({self.title!r}, isbn={self.isbn!r})"
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from to_dict() output; unknown keys are ignored."""
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
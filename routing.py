@@ -0,0 +1,169 @@
+import threading
+import time
+from collections import deque
+
+QUERY_KINDS = ("isbn", "title")
+
+# Circuit breaker states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class ProviderStats:
+    """Rolling window of one provider's recent searches for one kind of query.
+
+    Each search is recorded as its latency and an outcome: "hit" (a book
+    was found), "miss" (the provider answered but had nothing) or "error".
+    """
+
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+
+    def record(self, latency, outcome):
+        self.samples.append((latency, outcome))
+
+    def rate(self, outcome):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, result in self.samples if result == outcome) / len(self.samples)
+
+    def mean_latency(self):
+        if not self.samples:
+            return 0.0
+        return sum(latency for latency, _ in self.samples) / len(self.samples)
+
+    def summary(self):
+        return {
+            "samples": len(self.samples),
+            "mean_latency_ms": round(self.mean_latency() * 1000, 1),
+            "hit_rate": round(self.rate("hit"), 3),
+            "error_rate": round(self.rate("error"), 3),
+        }
+
+    def score(self):
+        """Expected seconds spent per book found; lower is better."""
+        # Misses and errors both cost a request without producing a book
+        return self.mean_latency() / max(self.rate("hit"), 0.05)
+
+class ProviderRouter:
+    """Order book providers by recent health, and stop calling failing ones.
+
+    `providers` is the default order, used until every provider has
+    `min_samples` searches for a kind of query. After that providers are
+    sorted by score, but a provider only moves ahead of one listed before
+    it when its score is better by `switch_ratio`, so a small difference
+    doesn't flip the order back and forth.
+
+    Each provider has a circuit breaker. `failure_threshold` errors in a
+    row open it, and the provider is left out of every plan. After
+    `cooldown` seconds it goes half-open: the next plan includes it as a
+    single probe. A probe that gets an answer (hit or miss) closes the
+    circuit; an error opens it again. A probe whose result never comes back
+    (e.g. a hedged attempt that was cancelled) stops counting after
+    another `cooldown`.
+    """
+
+    def __init__(self, providers, window=50, min_samples=10, switch_ratio=2.0,
+                 failure_threshold=5, cooldown=30, enabled=True, metrics=None):
+        self.providers = list(providers)
+        self.min_samples = min_samples
+        self.switch_ratio = switch_ratio
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.enabled = enabled
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._stats = {(provider, kind): ProviderStats(window) for provider in self.providers for kind in QUERY_KINDS}
+        self._state = {provider: CLOSED for provider in self.providers}
+        self._failures = {provider: 0 for provider in self.providers}
+        self._opened_at = {provider: 0.0 for provider in self.providers}
+        self._probe_started = {provider: None for provider in self.providers}
+        if metrics:
+            for provider in self.providers:
+                for state in (CLOSED, OPEN, HALF_OPEN):
+                    metrics.gauge("provider_circuit_state",
+                                  lambda provider=provider, state=state: int(self.state(provider) == state),
+                                  provider=provider, state=state)
+
+    def state(self, provider):
+        with self._lock:
+            return self._current_state(provider, time.time())
+
+    def _current_state(self, provider, now):
+        if self._state[provider] == OPEN and now - self._opened_at[provider] >= self.cooldown:
+            self._transition(provider, HALF_OPEN)
+        return self._state[provider]
+
+    def _transition(self, provider, state):
+        self._state[provider] = state
+        if state == OPEN:
+            self._opened_at[provider] = time.time()
+        if state != HALF_OPEN:
+            self._probe_started[provider] = None
+        if self.metrics:
+            self.metrics.inc("provider_circuit_transitions", provider=provider, state=state)
+
+    def _allow(self, provider, now):
+        """Whether a new plan may call `provider`; claims the probe when half-open."""
+        state = self._current_state(provider, now)
+        if state == CLOSED:
+            return True
+        if state == HALF_OPEN:
+            started = self._probe_started[provider]
+            if started is None or now - started >= self.cooldown:
+                self._probe_started[provider] = now
+                return True
+        return False
+
+    def _rank(self, available, kind):
+        stats = {provider: self._stats[(provider, kind)] for provider in available}
+        if any(len(stats[provider].samples) < self.min_samples for provider in available):
+            return available
+        # A provider listed later must beat an earlier one by switch_ratio to overtake it
+        return sorted(available, key=lambda provider: stats[provider].score()
+                      * self.switch_ratio ** self.providers.index(provider))
+
+    def order(self, kind):
+        """Return the providers to try for a kind of query, best first."""
+        if not self.enabled:
+            return list(self.providers)
+        now = time.time()
+        with self._lock:
+            ordered = self._rank([provider for provider in self.providers if self._allow(provider, now)], kind)
+        if self.metrics:
+            for provider in self.providers:
+                if provider not in ordered:
+                    self.metrics.inc("provider_skipped", provider=provider, kind=kind)
+        return ordered
+
+    def record(self, provider, kind, latency, outcome):
+        """Record one search's latency and outcome ("hit", "miss" or "error")."""
+        with self._lock:
+            self._stats[(provider, kind)].record(latency, outcome)
+            state = self._current_state(provider, time.time())
+            if outcome == "error":
+                self._failures[provider] += 1
+                if state == HALF_OPEN or (state == CLOSED and self._failures[provider] >= self.failure_threshold):
+                    self._transition(provider, OPEN)
+            else:
+                self._failures[provider] = 0
+                if state != CLOSED:
+                    self._transition(provider, CLOSED)
+
+    def status(self):
+        """Return each provider's circuit state and rolling stats, and the current order, for operations."""
+        now = time.time()
+        with self._lock:
+            closed = [provider for provider in self.providers if self._current_state(provider, now) != OPEN]
+            order = {kind: self._rank(closed, kind) if self.enabled else list(self.providers) for kind in QUERY_KINDS}
+            providers = {}
+            for provider in self.providers:
+                state = self._current_state(provider, now)
+                providers[provider] = {
+                    "state": state,
+                    "consecutive_errors": self._failures[provider],
+                    "retry_in": max(0.0, round(self._opened_at[provider] + self.cooldown - now, 1))
+                    if state == OPEN else None,
+                    "queries": {kind: self._stats[(provider, kind)].summary() for kind in QUERY_KINDS},
+                }
+        return {"enabled": self.enabled, "order": order, "providers": providers}
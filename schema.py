@@ -0,0 +1,239 @@
+import logging
+import math
+import threading
+import time
+from urllib.parse import unquote
+
+logger = logging.getLogger("notion_books.schema")
+
+# Notion API request limits (https://developers.notion.com/reference/request-limits)
+MAX_TEXT_LENGTH = 2000
+MAX_ARRAY_LENGTH = 100
+MAX_OPTION_LENGTH = 100
+MAX_URL_LENGTH = 2000
+
+class DatabaseSchema:
+    """Cached copy of a Notion database's property schema.
+
+    `fetch` is called to load the database object (`GET /databases/{id}`)
+    and should return it as a dict, or None on failure. The schema is
+    reloaded once it is older than `refresh_interval` seconds; if a reload
+    fails the previous copy keeps being used. Failed loads are retried
+    after `retry_base` seconds, doubling up to `refresh_interval`.
+
+    Only one caller fetches at a time, without holding the lock. While a
+    reload is in flight other callers keep using the previous copy; only
+    callers that have no copy at all wait for it.
+    """
+
+    def __init__(self, fetch, refresh_interval=3600, retry_base=5):
+        self.fetch = fetch
+        self.refresh_interval = refresh_interval
+        self.retry_base = retry_base
+        self._properties = None
+        self._loaded_at = 0
+        self._retry_at = 0
+        self._failures = 0
+        self._fetching = False
+        self._lock = threading.Condition()
+        self._warned = set()
+
+    def _due(self, now):
+        if now < self._retry_at:
+            return False
+        return self._properties is None or now - self._loaded_at >= self.refresh_interval
+
+    def properties(self):
+        """Return {property name: property schema}, or None if never loaded."""
+        with self._lock:
+            while True:
+                if not self._due(time.time()):
+                    return self._properties
+                if not self._fetching:
+                    break
+                if self._properties is not None:
+                    # Someone else is reloading; the previous copy will do until then
+                    return self._properties
+                self._lock.wait()
+            self._fetching = True
+
+        database = None
+        try:
+            database = self.fetch()
+        finally:
+            with self._lock:
+                self._fetching = False
+                if database is not None:
+                    self._properties = database.get("properties", {})
+                    self._loaded_at = time.time()
+                    self._failures = 0
+                    self._retry_at = 0
+                else:
+                    # Don't hammer the API when it keeps failing, but don't wait a whole refresh interval either
+                    self._failures += 1
+                    self._retry_at = time.time() + min(self.refresh_interval,
+                                                       self.retry_base * 2 ** (self._failures - 1))
+                self._lock.notify_all()
+        return self._properties
+
+    def invalidate(self):
+        """Force a reload on next use, e.g. after Notion rejects a payload."""
+        with self._lock:
+            self._loaded_at = 0
+            self._retry_at = 0
+
+    def warn_once(self, message, *args):
+        """Log a schema mismatch the first time it is seen, not for every book."""
+        key = (message,) + args
+        if key not in self._warned:
+            self._warned.add(key)
+            logger.warning(message, *args)
+
+    def title_property(self):
+        """Name of the database's title property, if the schema is known."""
+        properties = self.properties() or {}
+        for name, prop in properties.items():
+            if prop.get("type") == "title":
+                return name
+        return None
+
+    def resolve(self, name):
+        """Map a configured property name to the database's actual one.
+
+        Matches exactly first, then case-insensitively. The name "title"
+        always maps to the database's title property whatever it is called.
+        """
+        properties = self.properties()
+        if properties is None:
+            return name
+        if name in properties:
+            return name
+        if name.lower() == "title":
+            return self.title_property()
+        lowered = name.lower()
+        for actual in properties:
+            if actual.lower() == lowered:
+                return actual
+        return None
+
+    def property_ids(self, names):
+        """IDs of the named properties (resolved as in resolve()), or None if the schema isn't known.
+
+        Names the database doesn't have are left out.
+        """
+        properties = self.properties()
+        if properties is None:
+            return None
+        ids = []
+        for name in names:
+            prop = properties.get(self.resolve(name))
+            if prop and prop.get("id"):
+                # Notion reports IDs URL-encoded; the HTTP client encodes query parameters itself
+                ids.append(unquote(prop["id"]))
+        return ids
+
+def value_type(value):
+    """The property type a write payload value is written as."""
+    for key in ("title", "rich_text", "multi_select", "select", "url", "number", "date"):
+        if key in value:
+            return key
+    return None
+
+def plain_text(value, kind):
+    """Flatten a write payload value into plain text."""
+    content = value.get(kind)
+    if kind in ("title", "rich_text"):
+        return "".join(item.get("text", {}).get("content", "") for item in content or [])
+    if kind == "multi_select":
+        return ", ".join(option["name"] for option in content or [])
+    if kind == "select":
+        return content["name"] if content else ""
+    if kind == "date":
+        return content.get("start", "") if content else ""
+    return "" if content is None else str(content)
+
+def text_value(kind, text):
+    return {kind: [{"text": {"content": text[:MAX_TEXT_LENGTH]}}] if text else []}
+
+def coerce(value, kind, target):
+    """Convert a write payload value to the database's property type.
+
+    Returns the converted value, or None if there is no sensible conversion.
+    """
+    if kind == target:
+        return value
+    if target in ("rich_text", "title"):
+        return text_value(target, plain_text(value, kind))
+    if kind == "multi_select" and target == "select":
+        options = value["multi_select"]
+        return {"select": options[0] if options else None}
+    if kind == "select" and target == "multi_select":
+        return {"multi_select": [value["select"]] if value["select"] else []}
+    if kind in ("rich_text", "title") and target == "url":
+        text = plain_text(value, kind)
+        return {"url": text or None}
+    if kind in ("rich_text", "title") and target == "number":
+        try:
+            return {"number": float(plain_text(value, kind))}
+        except ValueError:
+            return None
+    return None
+
+def clean_option(option):
+    # Notion rejects commas in select option names and caps their length
+    return {"name": option["name"].replace(",", "")[:MAX_OPTION_LENGTH].strip()}
+
+def enforce_limits(value, kind):
+    """Trim a write payload value to Notion's request limits."""
+    if kind in ("title", "rich_text"):
+        items = [
+            {**item, "text": {**item["text"], "content": item["text"]["content"][:MAX_TEXT_LENGTH]}}
+            for item in value[kind][:MAX_ARRAY_LENGTH]
+        ]
+        return {kind: items}
+    if kind == "multi_select":
+        options = []
+        seen = set()
+        for option in value["multi_select"]:
+            option = clean_option(option)
+            # Duplicate or empty option names are rejected as well
+            if option["name"] and option["name"] not in seen:
+                seen.add(option["name"])
+                options.append(option)
+        return {"multi_select": options[:MAX_ARRAY_LENGTH]}
+    if kind == "select":
+        option = clean_option(value["select"]) if value["select"] else None
+        return {"select": option if option and option["name"] else None}
+    if kind == "url":
+        url = value["url"]
+        return {"url": url if url and len(url) <= MAX_URL_LENGTH else None}
+    if kind == "number":
+        number = value["number"]
+        return {"number": number if number is None or math.isfinite(number) else None}
+    return value
+
+def validate_properties(properties, schema):
+    """Map, type-check and trim a properties payload against the schema.
+
+    Returns the payload that is safe to send. Properties whose column is
+    missing, or whose value can't be converted to the column's type, are
+    dropped with a warning rather than failing the whole update.
+    """
+    database_properties = schema.properties()
+    if database_properties is None:
+        return properties
+
+    valid = {}
+    for name, value in properties.items():
+        actual = schema.resolve(name)
+        if actual is None:
+            schema.warn_once("Database has no '%s' property, not writing it", name)
+            continue
+        kind = value_type(value)
+        target = database_properties[actual].get("type")
+        converted = coerce(value, kind, target)
+        if converted is None:
+            schema.warn_once("Can't write %s value to '%s' (a %s property), skipping it", kind, actual, target)
+            continue
+        valid[actual] = enforce_limits(converted, target)
+    return valid
@@ -0,0 +1,207 @@
+import json
+import re
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+TENANT_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class Tenant:
+    """One Notion database and the integration token used to reach it.
+
+    `limiter` is the token's rate limiter; tenants that share a token share
+    the limiter too, since Notion's rate limit applies per integration.
+    """
+
+    def __init__(self, name, api_key, database_id, notion_version, limiter, sync_state_file, webhook_secret=None):
+        self.name = name
+        self.database_id = database_id
+        self.limiter = limiter
+        self.sync_state_file = sync_state_file
+        self.webhook_secret = webhook_secret
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json",
+            "Notion-Version": notion_version,
+        }
+        self.schema = None
+
+    def __repr__(self):
+        return f"Tenant({self.name!r})"
+
+def load_tenant_config(value=None, path=None):
+    """Read the tenant list from a JSON string or a JSON file.
+
+    Accepts a list of objects with a `name`, or an object keyed by name.
+    Every tenant needs `notion_api_key` and `database_id`; `rate_limit`,
+    `sync_state_file` and `webhook_secret` are optional. Returns None when
+    neither source is set. Raises ValueError if the config is malformed.
+    """
+    if path:
+        with open(path) as f:
+            config = json.load(f)
+    elif value:
+        config = json.loads(value)
+    else:
+        return None
+
+    if isinstance(config, dict):
+        config = [{"name": name, **entry} for name, entry in config.items()]
+    if not isinstance(config, list) or not config:
+        raise ValueError("Tenant config must be a non-empty list or object")
+
+    names = set()
+    for entry in config:
+        name = entry.get("name")
+        if not name or not TENANT_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid tenant name: {name!r}")
+        if name in names:
+            raise ValueError(f"Duplicate tenant name: {name!r}")
+        names.add(name)
+        for key in ("notion_api_key", "database_id"):
+            if not entry.get(key):
+                raise ValueError(f"Tenant {name!r} is missing {key}")
+    return config
+
+class Lane:
+    """One source's share of a FairScheduler run."""
+
+    def __init__(self, key, iterator):
+        self.key = key
+        self.iterator = iterator
+        self.buffer = deque()
+        self.done = False
+        self.error = None
+        self.items = []
+        self.results = []
+        self.futures = []
+
+class FairScheduler:
+    """Share one pool of workers fairly between several streams of work.
+
+    Each source is drained by its own feeder thread into a small buffer,
+    and items are handed to the pool round-robin across the sources that
+    have work waiting. A tenant with thousands of books gets the same share
+    of workers as one with a single book, and a source that is slow to
+    produce (e.g. waiting on its own rate limit) doesn't hold up the others.
+    """
+
+    def __init__(self, workers, buffer_size=None):
+        self.workers = workers
+        self.buffer_size = buffer_size or max(1, workers * 2)
+
+    def run(self, sources, handle):
+        """Call `handle(item)` for every item of every source.
+
+        `sources` maps a key to an iterator. Returns a dict of key -> Lane
+        holding the items seen, their results and, if the iterator raised,
+        the exception. Lanes are filled even if a handler raises: the item's
+        result is None, and the first handler exception is re-raised once
+        every lane has been drained.
+        """
+        lanes = [Lane(key, iter(iterator)) for key, iterator in sources.items()]
+        if self.workers <= 1:
+            self._run_sequential(lanes, handle)
+        else:
+            self._run_pooled(lanes, handle)
+        return {lane.key: lane for lane in lanes}
+
+    def _run_sequential(self, lanes, handle):
+        # Deterministic single-worker mode: take one item from each source in turn
+        active = list(lanes)
+        error = None
+        while active:
+            for lane in list(active):
+                try:
+                    item = next(lane.iterator)
+                except StopIteration:
+                    active.remove(lane)
+                    continue
+                except Exception as e:
+                    lane.error = e
+                    active.remove(lane)
+                    continue
+                lane.items.append(item)
+                try:
+                    lane.results.append(handle(item))
+                except Exception as e:
+                    lane.results.append(None)
+                    error = error or e
+        if error is not None:
+            raise error
+
+    def _run_pooled(self, lanes, handle):
+        condition = threading.Condition()
+        free = [self.workers]
+
+        def feed(lane):
+            try:
+                for item in lane.iterator:
+                    with condition:
+                        while len(lane.buffer) >= self.buffer_size:
+                            condition.wait()
+                        lane.buffer.append(item)
+                        condition.notify_all()
+            except Exception as e:
+                lane.error = e
+            finally:
+                with condition:
+                    lane.done = True
+                    condition.notify_all()
+
+        def release(_):
+            with condition:
+                free[0] += 1
+                condition.notify_all()
+
+        def next_item(start):
+            # Round-robin from `start`; returns (lane index, item) or None
+            for offset in range(len(lanes)):
+                index = (start + offset) % len(lanes)
+                if lanes[index].buffer:
+                    return index, lanes[index].buffer.popleft()
+            return None
+
+        feeders = [
+            threading.Thread(target=feed, args=(lane,), name=f"feeder-{lane.key}", daemon=True)
+            for lane in lanes
+        ]
+        for feeder in feeders:
+            feeder.start()
+
+        position = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                while True:
+                    with condition:
+                        picked = None
+                        while True:
+                            if free[0] > 0:
+                                picked = next_item(position)
+                            if picked or all(lane.done and not lane.buffer for lane in lanes):
+                                break
+                            condition.wait()
+                        if picked is None:
+                            break
+                        free[0] -= 1
+                        # Wake a feeder waiting on the buffer we just took from
+                        condition.notify_all()
+                    index, item = picked
+                    position = index + 1
+                    lane = lanes[index]
+                    future = executor.submit(handle, item)
+                    future.add_done_callback(release)
+                    lane.items.append(item)
+                    lane.futures.append(future)
+        finally:
+            errors = []
+            for lane in lanes:
+                for future in lane.futures:
+                    try:
+                        lane.results.append(future.result())
+                    except Exception as e:
+                        # Keep results lined up with items
+                        lane.results.append(None)
+                        errors.append(e)
+            if errors:
+                raise errors[0]
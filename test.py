@@ -14,12 +14,14 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-# Check if API key and database ID are set
-if not os.getenv("NOTION_API_KEY"):
+# Check if API key and database ID are set (not needed when TENANTS lists the databases)
+multi_tenant = os.getenv("TENANTS") or os.getenv("TENANTS_FILE")
+
+if not multi_tenant and not os.getenv("NOTION_API_KEY"):
     print("Error: NOTION_API_KEY not set in .env file")
     sys.exit(1)
 
-if not os.getenv("DATABASE_ID"):
+if not multi_tenant and not os.getenv("DATABASE_ID"):
     print("Error: DATABASE_ID not set in .env file")
     sys.exit(1)
 
@@ -39,7 +41,7 @@ if __name__ == "__main__":
     
     print(f"Found {len(semicolon_books)} books with semicolons in the title:")
     for book in semicolon_books:
-        print(f"- {book['title']}")
+        print(f"- {book.title}")
     
     # Ask if the user wants to process the books
     user_input = input("\nDo you want to process these books and fetch metadata? (y/n): ")
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Run several polling workers that split the Notion databases between them.
+
+Each worker is its own process running the polling loop with WORKER_COUNT
+and WORKER_INDEX set. It processes only the pages whose ID hashes to its
+shard, and holds a lease on each page in a shared SQLite file (LEASE_PATH)
+while it works on it, so no page is looked up or updated twice. Every
+worker still scans, because Notion can't filter by shard, but a scan is
+cheap next to the lookups and updates it saves.
+
+Each worker uses 1/WORKER_COUNT of every configured rate limit, since
+Notion and the book APIs count requests per key, not per process.
+
+A worker that crashes or hangs stops sending heartbeats. After LEASE_TTL
+seconds the others take over its pages. It is restarted here, and takes
+its shard back once it is running again.
+
+    python workers.py --processes 4
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+logger = logging.getLogger("notion_books.workers")
+
+def run_worker(index, count):
+    """Entry point of one worker process."""
+    # Ctrl-C goes to the whole process group; the supervisor stops workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Set before app is imported, since it reads its configuration at import time
+    os.environ["WORKER_COUNT"] = str(count)
+    os.environ["WORKER_INDEX"] = str(index)
+    import app
+    logger.info("Worker %d of %d started (pid %d)", index, count, os.getpid())
+    app.start_polling()
+
+def supervise(count, restart_delay):
+    """Start `count` workers and restart any that exit, until interrupted."""
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}
+    restart_at = {}
+
+    def start(index):
+        process = ctx.Process(target=run_worker, args=(index, count), name=f"worker-{index}", daemon=True)
+        process.start()
+        processes[index] = process
+
+    for index in range(count):
+        start(index)
+    try:
+        while True:
+            time.sleep(1)
+            now = time.time()
+            for index, process in processes.items():
+                if process.is_alive() or index in restart_at:
+                    continue
+                logger.warning("Worker %d exited with code %s, restarting in %.0fs",
+                               index, process.exitcode, restart_delay)
+                restart_at[index] = now + restart_delay
+            for index, due in list(restart_at.items()):
+                if due <= now:
+                    del restart_at[index]
+                    start(index)
+    except KeyboardInterrupt:
+        logger.info("Stopping %d worker(s)", count)
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: one per CPU)")
+    parser.add_argument("--restart-delay", type=float, default=5,
+                        help="seconds before a worker that exited is started again (default: 5)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    supervise(args.processes, args.restart_delay)
+
+if __name__ == "__main__":
+    main()